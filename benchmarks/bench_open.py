@@ -0,0 +1,65 @@
+"""
+Benchmark of opening a dataset with many variables.
+
+Each of the variables of the synthetic dataset has its own dimension,
+in addition to a shared time dimension. The time to open the dataset,
+to look up one variable and to list all the variables is reported for
+cold opens, which request and parse the DDS and DAS, and for warm opens
+from a metadata cache.
+
+Usage: python benchmarks/bench_open.py [nvars] [repeat]
+"""
+import sys
+import shutil
+import tempfile
+import timeit
+
+import numpy as np
+from pydap.model import DatasetType, BaseType, Float32
+
+import netcdf4_pydap
+from server import Server
+
+
+def synthetic_dataset(nvars):
+    dataset = DatasetType('many')
+    for index in range(nvars):
+        name = 'var%05d' % index
+        dim = 'dim%05d' % index
+        dataset[name] = BaseType(name, np.zeros((2, 3), dtype='>f4'),
+                                 shape=(2, 3), dimensions=('time', dim),
+                                 type=Float32, attributes={'units': 'K'})
+    dataset._set_id()
+    return dataset
+
+
+def main(nvars=5000, repeat=3):
+    directory = tempfile.mkdtemp()
+    try:
+        with Server(synthetic_dataset(nvars)) as server:
+            # Cold opens request and parse the DDS and DAS; warm opens
+            # load the structure from a metadata cache:
+            metadata_cache = netcdf4_pydap.MetadataCache(directory)
+            netcdf4_pydap.Dataset(server.url,
+                                  metadata_cache=metadata_cache).close()
+            print('%d variables' % nvars)
+            for mode, cache in [('cold', None), ('warm', metadata_cache)]:
+                def open_dataset():
+                    return netcdf4_pydap.Dataset(server.url,
+                                                 metadata_cache=cache)
+
+                timings = [('open', open_dataset),
+                           ('one variable',
+                            lambda: open_dataset().variables['var00042'].shape),
+                           ('all variables',
+                            lambda: [var.shape for var in
+                                     open_dataset().variables.values()])]
+                for name, function in timings:
+                    best = min(timeit.repeat(function, number=1,
+                                             repeat=repeat))
+                    print('%-4s %-14s %8.1f ms' % (mode, name, best * 1e3))
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,218 @@
+"""
+Benchmark suite of Dataset and httpserver.Dataset against a local server.
+
+Measures, under the simulated network conditions of server.Conditions:
+
+    open                time to open a dataset, without metadata cache
+    slice_throughput    MB/s of a read of the whole variable
+    small_reads         single-value reads per second
+    large_read_memory   peak memory of the whole read, over the array size
+    wget_throughput     MB/s of a file download over one connection
+    ranged_wget         MB/s of a file download over four connections
+
+Results are written as JSON, with the commit and the conditions, so that
+runs can be compared across commits. With --baseline, the ratio of each
+result to that of a previous run is printed on stderr.
+
+Usage: python benchmarks/bench_suite.py [--latency S] [--bandwidth B/s]
+           [--error-rate R] [--ntime N] [--repeat N] [--output FILE]
+           [--baseline FILE]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+
+import numpy as np
+from pydap.model import DatasetType, BaseType, Float32, Float64
+
+import netcdf4_pydap
+from server import Server, FileApp
+
+
+def synthetic_dataset(ntime, nlat=180, nlon=360):
+    dataset = DatasetType('bench')
+    shape = (ntime, nlat, nlon)
+    dims = ('time', 'lat', 'lon')
+    dataset['tas'] = BaseType('tas',
+                              np.random.RandomState(0).rand(*shape).astype('>f4'),
+                              shape=shape, dimensions=dims, type=Float32,
+                              attributes={'units': 'K'})
+    for dim, length in zip(dims, shape):
+        dataset[dim] = BaseType(dim, np.arange(length, dtype='>f8'),
+                                shape=(length,), dimensions=(dim,),
+                                type=Float64)
+    dataset._set_id()
+    return dataset
+
+
+def best_of(function, repeat):
+    timings = []
+    for index in range(repeat):
+        start = time.time()
+        function()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def bench_dataset(url, repeat, nsmall, dataset_kwargs):
+    results = []
+
+    def open_dataset():
+        netcdf4_pydap.Dataset(url, **dataset_kwargs).close()
+    results.append(('open', best_of(open_dataset, repeat), 's'))
+
+    with netcdf4_pydap.Dataset(url, **dataset_kwargs) as dataset:
+        tas = dataset.variables['tas']
+        size = tas.size * 4 / 2.0**20
+        elapsed = best_of(lambda: tas[...], repeat)
+        results.append(('slice_throughput', size / elapsed, 'MB/s'))
+
+        indices = np.random.RandomState(0).randint(0, tas.shape[0], nsmall)
+        elapsed = best_of(lambda: [tas[index, 0, 0] for index in indices],
+                          repeat)
+        results.append(('small_reads', nsmall / elapsed, 'reads/s'))
+
+        counters = dataset.stats.snapshot()['counters']
+        results.append(('requests', counters.get('requests.dods', 0),
+                        'requests'))
+        results.append(('errors', counters.get('errors.dods', 0),
+                        'requests'))
+    return results
+
+
+def _large_read(url, dataset_kwargs, queue):
+    # Run in a new process, whose peak memory only includes this read:
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with netcdf4_pydap.Dataset(url, **dataset_kwargs) as dataset:
+        data = dataset.variables['tas'][...]
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kB on Linux:
+    queue.put((peak - baseline) * 1024.0 / data.nbytes)
+
+
+def bench_large_read_memory(url, dataset_kwargs):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_large_read,
+                                      args=(url, dataset_kwargs, queue))
+    process.start()
+    ratio = queue.get()
+    process.join()
+    return [('large_read_memory', ratio, 'x array size')]
+
+
+def bench_wget(url, size, repeat, dataset_kwargs):
+    results = []
+    directory = tempfile.mkdtemp()
+    try:
+        for name, max_connections in [('wget_throughput', 1),
+                                      ('ranged_wget', 4)]:
+            dest_name = os.path.join(directory, 'file.nc')
+
+            def wget():
+                if os.path.exists(dest_name):
+                    os.remove(dest_name)
+                with netcdf4_pydap.http_Dataset(url,
+                                                **dataset_kwargs) as dataset:
+                    dataset.wget(dest_name, max_connections=max_connections,
+                                 range_size=max(1, size // 16))
+            elapsed = best_of(wget, repeat)
+            results.append((name, size / 2.0**20 / elapsed, 'MB/s'))
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds added before each response.')
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help='Bytes per second of each response.')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of requests answered with 503. '
+                             'Requests are then retried.')
+    parser.add_argument('--ntime', type=int, default=100,
+                        help='Time steps of the 180x360 variable read.')
+    parser.add_argument('--small-reads', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='JSON file, default stdout.')
+    parser.add_argument('--baseline', help='JSON file of a previous run.')
+    args = parser.parse_args(argv)
+
+    conditions = {'latency': args.latency, 'bandwidth': args.bandwidth,
+                  'error_rate': args.error_rate}
+    dataset_kwargs = {}
+    if args.error_rate:
+        dataset_kwargs['retry'] = netcdf4_pydap.RetryPolicy(
+            max_retries=10, backoff_factor=0.01, failure_threshold=None)
+
+    results = []
+    with Server(synthetic_dataset(args.ntime), **conditions) as server:
+        results.extend(bench_dataset(server.url, args.repeat,
+                                     args.small_reads, dataset_kwargs))
+        results.extend(bench_large_read_memory(server.url, dataset_kwargs))
+        injected = server.app.errors
+
+    content = np.random.RandomState(0).bytes(args.ntime * 180 * 360 * 4)
+    with Server(FileApp(content), name='file.nc', **conditions) as server:
+        results.extend(bench_wget(server.url, len(content), args.repeat,
+                                  dataset_kwargs))
+        injected += server.app.errors
+
+    report = {'commit': commit(),
+              'python': platform.python_version(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'conditions': conditions,
+              'ntime': args.ntime,
+              'injected_errors': injected,
+              'results': [{'name': name, 'value': value, 'unit': unit}
+                          for name, value, unit in results]}
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            compare(json.load(baseline_file), report)
+    return report
+
+
+def compare(baseline, report):
+    if baseline['conditions'] != report['conditions']:
+        sys.stderr.write('Warning: the baseline was run in other conditions: '
+                         '%s\n' % baseline['conditions'])
+    previous = dict((result['name'], result['value'])
+                    for result in baseline['results'])
+    sys.stderr.write('%-20s %12s %12s %8s  (%s)\n' %
+                     ('', str(baseline['commit'])[:10],
+                      str(report['commit'])[:10], 'ratio', 'unit'))
+    for result in report['results']:
+        value = previous.get(result['name'], float('nan'))
+        ratio = result['value'] / float(value) if value else float('nan')
+        sys.stderr.write('%-20s %12.4g %12.4g %8.2f  (%s)\n' %
+                         (result['name'], value, result['value'], ratio,
+                          result['unit']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of the decoding of .dods responses.
+
+Compares pydap's DapUnpacker, as used before, with the streaming decoder
+of netcdf4_pydap.requests_pydap.xdr used by ArrayProxy, on a synthetic
+Float32 grid delivered in chunks. The streaming decoder is timed into new
+arrays and into a preallocated native-endian array, which goes through
+the chunked conversion.
+
+Usage: python benchmarks/bench_xdr.py [ntime] [repeat]
+"""
+import sys
+import timeit
+
+import numpy as np
+from pydap.model import DatasetType, BaseType, GridType, Float32, Float64
+from pydap.parsers.dds import DDSParser
+from pydap.responses.dods import DODSResponse
+from pydap.xdr import DapUnpacker
+
+from netcdf4_pydap.requests_pydap import xdr
+
+
+def response(ntime, nlat=180, nlon=360):
+    dataset = DatasetType('bench')
+    shape = (ntime, nlat, nlon)
+    dims = ('time', 'lat', 'lon')
+    grid = GridType('tas')
+    grid['tas'] = BaseType('tas', np.random.rand(*shape).astype('>f4'),
+                           shape=shape, dimensions=dims, type=Float32)
+    for dim, length in zip(dims, shape):
+        grid[dim] = BaseType(dim, np.arange(length, dtype='>f8'),
+                             shape=(length,), dimensions=(dim,), type=Float64)
+    dataset['tas'] = grid
+    dataset._set_id()
+    return ''.join(DODSResponse.serialize(dataset))
+
+
+def decode_dapunpacker(data):
+    dds, xdrdata = data.split('\nData:\n', 1)
+    dataset = DDSParser(dds).parse()
+    return DapUnpacker(xdrdata, dataset).getvalue()
+
+
+def _chunks(data):
+    return (data[start:start + xdr.CHUNK_SIZE]
+            for start in xrange(0, len(data), xdr.CHUNK_SIZE))
+
+
+def decode_stream(data, targets=None):
+    reader = xdr.StreamReader(_chunks(data))
+    dataset = DDSParser(reader.read_header()).parse()
+    return xdr.unpack_stream(reader, dataset, targets)
+
+
+def main(ntime=100, repeat=5):
+    data = response(ntime)
+    size = len(data) / 2.0 ** 20
+    print('response size: %.1f MB' % size)
+    out = np.empty((ntime, 180, 360), dtype='f4')
+    for name, function in [('DapUnpacker', decode_dapunpacker),
+                           ('stream', decode_stream),
+                           ('stream into',
+                            lambda data: decode_stream(data, {'tas.tas': out}))]:
+        best = min(timeit.repeat(lambda: function(data),
+                                 number=1, repeat=repeat))
+        print('%-12s %8.2f ms %10.1f MB/s' % (name, best * 1e3, size / best))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
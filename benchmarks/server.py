@@ -0,0 +1,138 @@
+"""
+A local OPeNDAP server for benchmarks.
+
+Serves a pydap dataset, or any WSGI application, from a thread of the
+benchmark process. Network conditions can be simulated: a latency added
+before each response, a bandwidth limit on response bodies and a rate of
+requests answered with 503 Service Unavailable.
+"""
+import time
+import random
+import threading
+from SocketServer import ThreadingMixIn
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
+
+from pydap.model import DatasetType
+from pydap.handlers.lib import SimpleHandler
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class Conditions(object):
+    """
+    Wrap a WSGI application to simulate network conditions.
+
+    Parameters
+    ----------
+
+    app : WSGI application
+    latency : float, optional
+        Seconds waited before each response.
+        Default: 0.
+    bandwidth : float, optional
+        Bytes per second at which each response body is sent.
+        Default: None, no limit.
+    error_rate : float, optional
+        Fraction of requests answered with 503.
+        Default: 0.
+    seed : int, optional
+        Seed of the error injection, so that runs are comparable.
+        Default: 0.
+    """
+    def __init__(self, app, latency=0.0, bandwidth=None, error_rate=0.0,
+                 seed=0):
+        self.app = app
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        time.sleep(self.latency)
+        with self._lock:
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if fail:
+            start_response('503 Service Unavailable',
+                           [('Content-type', 'text/plain'),
+                            ('Retry-After', '0')])
+            return ['503 Service Unavailable']
+        body = self.app(environ, start_response)
+        if self.bandwidth is None:
+            return body
+        return self._throttle(body)
+
+    def _throttle(self, body):
+        piece_size = max(1, int(self.bandwidth / 100))
+        for chunk in body:
+            for start in xrange(0, len(chunk), piece_size):
+                piece = chunk[start:start + piece_size]
+                time.sleep(len(piece) / float(self.bandwidth))
+                yield piece
+
+
+class FileApp(object):
+    """
+    Serve `content` as a file, with byte ranges.
+    """
+    def __init__(self, content):
+        self.content = content
+
+    def __call__(self, environ, start_response):
+        headers = [('Content-type', 'application/x-netcdf'),
+                   ('Accept-Ranges', 'bytes')]
+        if 'HTTP_RANGE' not in environ:
+            headers.append(('Content-Length', str(len(self.content))))
+            start_response('200 OK', headers)
+            return [self.content]
+        start, stop = environ['HTTP_RANGE'].split('=')[1].split('-')
+        start, stop = int(start), int(stop) + 1
+        headers.extend([('Content-Length', str(stop - start)),
+                        ('Content-Range', 'bytes %d-%d/%d' %
+                         (start, stop - 1, len(self.content)))])
+        start_response('206 Partial Content', headers)
+        return [self.content[start:stop]]
+
+
+class Server(object):
+    """
+    Serve `dataset` at ``server.url`` until ``server.stop()``.
+
+    `dataset` is a pydap dataset or a WSGI application, served under
+    `name`. Other keyword arguments are passed to Conditions.
+    """
+    def __init__(self, dataset, name=None, **conditions):
+        if isinstance(dataset, DatasetType):
+            app = SimpleHandler(dataset)
+            name = dataset.name
+        else:
+            app = dataset
+        self.app = Conditions(app, **conditions)
+        self._server = make_server('127.0.0.1', 0, self.app,
+                                   server_class=_ThreadingServer,
+                                   handler_class=_QuietHandler)
+        self.url = 'http://127.0.0.1:%d/%s' % (self._server.server_port,
+                                                name)
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
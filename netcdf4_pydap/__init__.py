@@ -1,4 +1,11 @@
 from core import Dataset
 from httpserver import Dataset as http_Dataset
+from asynchronous import AsyncDataset
+from mfdataset import MFDataset
+from requests_pydap.cache import BlockCache, MetadataCache
+from cas.cookie_store import CookieStore
+from retries import RetryPolicy
+from stats import Stats, process_stats
 
-all = [Dataset, http_Dataset]
+all = [Dataset, http_Dataset, AsyncDataset, MFDataset, BlockCache,
+       MetadataCache, CookieStore, RetryPolicy, Stats]
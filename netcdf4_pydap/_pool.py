@@ -0,0 +1,27 @@
+"""
+Thread pool helper shared by the readers and downloaders.
+"""
+
+from multiprocessing.pool import ThreadPool
+
+__all__ = ['thread_map']
+
+
+def thread_map(function, items, max_workers):
+    """
+    Apply `function` to `items`, concurrently when `max_workers` > 1.
+
+    Results are discarded. The first exception raised by `function` is
+    raised once the pool is terminated.
+    """
+    if max_workers <= 1 or len(items) <= 1:
+        for item in items:
+            function(item)
+        return
+
+    pool = ThreadPool(min(max_workers, len(items)))
+    try:
+        for result in pool.imap_unordered(function, items):
+            pass
+    finally:
+        pool.terminate()
@@ -0,0 +1,150 @@
+"""
+Non-blocking access to OPeNDAP datasets.
+
+Datasets are opened and variables are read by a pool of threads shared
+by all AsyncDatasets. Operations return immediately with a
+multiprocessing.pool.AsyncResult whose get() method waits for the result::
+
+    datasets = [AsyncDataset(url) for url in urls]
+    reads = [dataset['tas'].read((0, slice(None), slice(None)))
+             for dataset in datasets]
+    data = [read.get() for read in reads]
+
+Opening and reading go through core.Dataset and therefore use the same
+DDS/DAS parsing, CAS authentication and error handling.
+"""
+
+import sys
+import threading
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+import six
+
+from . import core
+
+__all__ = ['AsyncDataset', 'AsyncVariable', 'set_max_workers']
+
+_pool = None
+_pool_size = 32
+_pool_lock = threading.Lock()
+
+
+def set_max_workers(max_workers):
+    """
+    Set the number of threads of the shared pool. Operations already
+    submitted complete in the previous pool.
+
+    Default: 32.
+    """
+    global _pool, _pool_size
+    with _pool_lock:
+        _pool_size = max_workers
+        if _pool is not None:
+            _pool.close()
+        _pool = None
+
+
+def _shared_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(_pool_size)
+        return _pool
+
+
+class AsyncDataset(object):
+    """
+    A Dataset opened in the background.
+
+    Parameters
+    ----------
+
+    url : str
+        Url of the dataset.
+    pool : multiprocessing.pool.ThreadPool, optional
+        Pool running the operations.
+        Default: a pool shared by all AsyncDatasets.
+    kwargs :
+        Passed to netcdf4_pydap.Dataset.
+    """
+    def __init__(self, url, pool=None, **kwargs):
+        self.url = url
+        self._pool = pool
+        self._dataset = None
+        self._exc_info = None
+        # AsyncResult.get only wakes one of several waiting threads,
+        # so the opening is signaled with an Event:
+        self._opened = threading.Event()
+        self.pool.apply_async(self._open, (url, kwargs))
+
+    @property
+    def pool(self):
+        # Operations wait for the dataset to be opened in their thread.
+        # Pools run tasks in order, so the opening has always started.
+        return self._pool or _shared_pool()
+
+    def _open(self, url, kwargs):
+        try:
+            self._dataset = core.Dataset(url, **kwargs)
+        except Exception:
+            self._exc_info = sys.exc_info()
+        finally:
+            self._opened.set()
+
+    def ready(self):
+        return self._opened.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the dataset to be opened and return it. Errors raised
+        while opening are raised here.
+        """
+        if not self._opened.wait(timeout):
+            raise TimeoutError
+        if self._exc_info is not None:
+            six.reraise(*self._exc_info)
+        return self._dataset
+
+    def __getitem__(self, name):
+        return AsyncVariable(self, name)
+
+    def fetch(self, requests_dict):
+        """
+        Read slices of several variables in a single request,
+        see netcdf4_pydap.Dataset.fetch.
+        """
+        return self.pool.apply_async(
+            lambda: self.result().fetch(requests_dict))
+
+    def close(self):
+        """
+        Close the dataset once it is opened.
+        """
+        def close():
+            self.result().close()
+        return self.pool.apply_async(close)
+
+    def __repr__(self):
+        return '<%s %s (%s)>' % (self.__class__.__name__, self.url,
+                                 'open' if self.ready() else 'opening')
+
+
+class AsyncVariable(object):
+    """
+    A variable of an AsyncDataset.
+    """
+    def __init__(self, dataset, name):
+        self._dataset = dataset
+        self.name = name
+
+    def read(self, index=Ellipsis):
+        """
+        Read `index` of the variable once the dataset is opened.
+        """
+        return self._dataset.pool.apply_async(
+            lambda: self._dataset.result().variables[self.name][index])
+
+    def __repr__(self):
+        return '<%s %s of %s>' % (self.__class__.__name__, self.name,
+                                  self._dataset.url)
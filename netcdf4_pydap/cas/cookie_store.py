@@ -0,0 +1,184 @@
+"""
+An on-disk store of authentication cookies.
+
+Cookies obtained by get_cookies.setup_session are saved under the
+authentication url and username so that other sessions, in this or
+other processes, can use them without logging in again. Logins are
+serialized with a file lock: threads or processes that need to log in
+at the same time wait for the first login and use its cookies.
+"""
+
+import os
+import time
+import datetime
+import hashlib
+import tempfile
+import contextlib
+import cPickle as pickle
+
+from . import get_cookies
+
+try:
+    import fcntl
+except ImportError:
+    # Windows:
+    fcntl = None
+    import msvcrt
+
+__all__ = ['CookieStore']
+
+
+class CookieStore(object):
+    """
+    A store of authentication cookies shared between threads and processes.
+
+    Parameters
+    ----------
+
+    directory : str, optional
+        Directory where cookies are stored. Created if it does not exist.
+        Default: ~/.netcdf4_pydap/cookies
+    expire_after : datetime.timedelta, optional
+        How long cookies are used. Cookies that expire earlier are used
+        until they expire.
+        Default: 12 hours.
+    """
+    def __init__(self, directory=None, expire_after=datetime.timedelta(hours=12)):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'),
+                                     '.netcdf4_pydap', 'cookies')
+        self.directory = directory
+        self.expire_after = expire_after
+        if not os.path.isdir(self.directory):
+            try:
+                # Cookies are credentials:
+                os.makedirs(self.directory, 0700)
+            except OSError:
+                # Created by another process:
+                if not os.path.isdir(self.directory):
+                    raise
+
+    def load(self, session, authentication_url, username=None, check_url=None):
+        """
+        Add the stored cookies to `session`. Returns the time at which they
+        were stored, or None if there are no valid cookies for
+        `authentication_url` and `username`.
+        """
+        entry = self._read(_key(authentication_url, username, check_url))
+        if entry is None:
+            return None
+        session.cookies.update(entry['cookies'])
+        return entry['time']
+
+    def login(self, session, authentication_url, username=None, password=None,
+              check_url=None, verify=True, rejected=None):
+        """
+        Log in with get_cookies.setup_session and store the cookies.
+        Returns the session.
+
+        `rejected` is the time, returned by load, of the cookies that were
+        rejected. If other cookies were stored since, by another thread or
+        process, they are used instead of logging in again.
+        """
+        key = _key(authentication_url, username, check_url)
+        with self._lock(key):
+            entry = self._read(key)
+            if entry is not None and entry['time'] != rejected:
+                session.cookies.update(entry['cookies'])
+                return session
+            session = get_cookies.setup_session(authentication_url,
+                                                username=username,
+                                                password=password,
+                                                check_url=check_url,
+                                                session=session,
+                                                verify=verify)
+            self._write(key, session.cookies)
+        return session
+
+    def clear(self):
+        """
+        Remove the stored cookies and their lock files.
+        """
+        for name in os.listdir(self.directory):
+            if name.endswith(('.pickle', '.lock')):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    # Removed by another process, or locked on Windows:
+                    pass
+
+    def _path(self, key, extension):
+        return os.path.join(self.directory,
+                            hashlib.sha1(key).hexdigest() + extension)
+
+    @contextlib.contextmanager
+    def _lock(self, key):
+        with open(self._path(key, '.lock'), 'a') as lock_file:
+            _lock_file(lock_file)
+            try:
+                yield
+            finally:
+                _unlock_file(lock_file)
+
+    def _read(self, key):
+        try:
+            with open(self._path(key, '.pickle'), 'rb') as entry_file:
+                entry = pickle.load(entry_file)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        if entry.get('key') != key or entry['expires'] <= time.time():
+            return None
+        return entry
+
+    def _write(self, key, cookies):
+        now = time.time()
+        expires = [now + self.expire_after.total_seconds()]
+        expires.extend(cookie.expires for cookie in cookies
+                       if cookie.expires is not None)
+        entry = {'key': key, 'time': now, 'expires': min(expires),
+                 'cookies': cookies}
+        # mkstemp creates files readable only by the user:
+        handle, temp_path = tempfile.mkstemp(dir=self.directory,
+                                             suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as entry_file:
+                pickle.dump(entry, entry_file, pickle.HIGHEST_PROTOCOL)
+            os.rename(temp_path, self._path(key, '.pickle'))
+        except:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+def _key(authentication_url, username, check_url):
+    """
+    Key of the cookies obtained by logging in at `authentication_url`.
+    For ESGF, the authentication url depends on the data node of
+    `check_url`.
+    """
+    if callable(authentication_url):
+        authentication_url = authentication_url(check_url)
+    return repr((authentication_url, username))
+
+
+def _lock_file(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return
+    # Lock the first byte, waiting as long as it takes:
+    lock_file.seek(0)
+    while True:
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except IOError:
+            # LK_LOCK gives up after 10 seconds:
+            pass
+
+
+def _unlock_file(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return
+    lock_file.seek(0)
+    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
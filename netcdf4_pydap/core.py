@@ -22,6 +22,7 @@ import os
 import datetime
 import numpy as np
 
+import collections
 from collections import OrderedDict
 
 import netCDF4.utils as utils
@@ -29,6 +30,10 @@ from pydap.exceptions import ServerError
 
 #Internal:
 from .requests_pydap import http
+from .requests_pydap import proxy
+from . import reductions
+from .maskandscale import Packing
+from .stats import Stats, process_stats
 
 python3=False
 default_encoding = 'utf-8'
@@ -37,7 +42,11 @@ class Dataset:
     def __init__(self, url, cache=None,
                  expire_after=datetime.timedelta(hours=1), timeout=120,
                  session=None, username=None, password=None,
-                 authentication_url=None, use_certificates=False):
+                 authentication_url=None, use_certificates=False,
+                 keep_alive=False, pool_maxsize=10,
+                 max_workers=1, max_tile_size=64 * 2**20, block_cache=None,
+                 metadata_cache=None, cookie_store=None, retry=None,
+                 stats=None, compression=True):
         self._url = url
         self.cache = cache
         self.expire_after = expire_after
@@ -47,6 +56,19 @@ class Dataset:
         self.password = password
         self.authentication_url = authentication_url
         self.use_certificates = use_certificates
+        self.keep_alive = keep_alive
+        self.pool_maxsize = pool_maxsize
+        self.max_workers = max_workers
+        self.max_tile_size = max_tile_size
+        self.block_cache = block_cache
+        self.metadata_cache = metadata_cache
+        self.cookie_store = cookie_store
+        self.retry = retry
+        self.compression = compression
+        if stats is None:
+            # Per-Dataset stats, also counted in the process-wide stats:
+            stats = Stats(parent=process_stats)
+        self.stats = stats
 
         _authenticate_or_raise(self.assign_pydap_instance)
 
@@ -58,6 +80,9 @@ class Dataset:
         self.path = '/'
         self.parent = None
         self.keepweakref = False
+        # Applied to the variables, see set_auto_maskandscale:
+        self._auto_mask = False
+        self._auto_scale = False
 
         self.dimensions = self._get_dims(self._pydap_instance._dataset)
         self.variables = self._get_vars(self._pydap_instance._dataset)
@@ -66,13 +91,26 @@ class Dataset:
         return
 
     def assign_pydap_instance(self, authenticate=False):
+        if '_pydap_instance' in self.__dict__:
+            # Release the pooled connections of the instance being replaced:
+            self._pydap_instance.close()
         self._pydap_instance = http.Pydap_Dataset(self._url, cache=self.cache,
                                                   expire_after=self.expire_after,
                                                   timeout=self.timeout, session=self.session, 
                                                   username=self.username, password=self.password, 
                                                   authentication_url=self.authentication_url,
                                                   use_certificates=self.use_certificates,
-                                                  authenticate=authenticate)
+                                                  authenticate=authenticate,
+                                                  keep_alive=self.keep_alive,
+                                                  pool_maxsize=self.pool_maxsize,
+                                                  max_workers=self.max_workers,
+                                                  max_tile_size=self.max_tile_size,
+                                                  block_cache=self.block_cache,
+                                                  metadata_cache=self.metadata_cache,
+                                                  cookie_store=self.cookie_store,
+                                                  retry=self.retry,
+                                                  stats=self.stats,
+                                                  compression=self.compression)
         return
 
     def __enter__(self):
@@ -159,17 +197,48 @@ class Dataset:
             return self.getncattr(name)
 
     def set_auto_maskandscale(self, flag):
-        raise NotImplementedError('set_auto_maskandscale is not implemented for pydap')
+        """
+        Call set_auto_maskandscale of all the variables, and of the
+        variables built later.
+        """
+        self.set_auto_mask(flag)
+        self.set_auto_scale(flag)
         return
 
     def set_auto_mask(self, flag):
-        raise NotImplementedError('set_auto_mask is not implemented for pydap')
+        self._auto_mask = bool(flag)
+        # Variables not yet built take the flag from the dataset:
+        for var in self.variables._values.values():
+            var.set_auto_mask(flag)
         return
 
     def set_auto_scale(self, flag):
-        raise NotImplementedError('set_auto_scale is not implemented for pydap')
+        self._auto_scale = bool(flag)
+        for var in self.variables._values.values():
+            var.set_auto_scale(flag)
         return
 
+    def fetch(self, requests_dict):
+        """
+        Read slices of several variables in a single request.
+
+        `requests_dict` maps variable names to indices, e.g.
+        ``dataset.fetch({'tas': (0, slice(None)), 'lat': slice(None)})``.
+        Returns a dictionary of arrays with the same keys, masked and
+        scaled as the variables read them.
+        """
+        names = list(requests_dict.keys())
+        try:
+            arrays = proxy.fetch_many([(self.variables[name]._array_proxy(),
+                                        requests_dict[name])
+                                       for name in names])
+        except requests.exceptions.HTTPError as e:
+            # 400 type errors were already retried with refreshed credentials
+            # by the data request:
+            raise ServerError(str(e))
+        return dict((name, self.variables[name]._unpack(array))
+                    for name, array in zip(names, arrays))
+
     def get_variables_by_attributes(self, **kwargs):
         #From netcdf4-python
         vs = []
@@ -200,24 +269,25 @@ class Dataset:
             unlimited_dims = [dataset.attributes['DODS_EXTRA']['Unlimited_Dimension'],]
         else:
             unlimited_dims = []
-        var_list = dataset.keys()
-        var_id = np.argmax(map(len, [dataset[varname].dimensions for varname in var_list]))
-        base_dimensions_list = dataset[var_list[var_id]].dimensions
-        base_dimensions_lengths = dataset[var_list[var_id]].shape
-        
-        for varname in var_list:
-            if not set(base_dimensions_list).issuperset(dataset[varname].dimensions):
-                for dim_id, dim in enumerate(dataset[varname].dimensions):
-                    if not dim in base_dimensions_list:
-                        base_dimensions_list += (dim,)
-                        base_dimensions_lengths += (dataset[varname].shape[dim_id],)
-        dimensions_dict = OrderedDict()
-        for dim, dim_length in zip( base_dimensions_list, base_dimensions_lengths):
-            dimensions_dict[dim] = Dimension(dataset, dim, size=dim_length, isunlimited=(dim in unlimited_dims))
-        return  dimensions_dict
+        var_list = [dataset[varname] for varname in dataset.keys()]
+
+        # Dimensions of the variable with the most dimensions come first,
+        # followed by the other dimensions in order of appearance:
+        base_var = max(var_list, key=lambda var: len(var.dimensions))
+        dimensions_lengths = OrderedDict(zip(base_var.dimensions, base_var.shape))
+        for var in var_list:
+            for dim, dim_length in zip(var.dimensions, var.shape):
+                if dim not in dimensions_lengths:
+                    dimensions_lengths[dim] = dim_length
+
+        def dimension(dim):
+            return Dimension(dataset, dim, size=dimensions_lengths[dim],
+                             isunlimited=(dim in unlimited_dims))
+        return _LazyMapping(dimensions_lengths.keys(), dimension)
 
     def _get_vars(self, dataset):
-        return {var:Variable(dataset[var], var, self) for var in dataset.keys()}
+        return _LazyMapping(dataset.keys(),
+                            lambda var: Variable(dataset[var], var, self))
 
 class Variable:
     def __init__(self, var, name, grp):
@@ -236,7 +306,10 @@ class Variable:
         self.datatype = self.dtype
         self.ndim = len(self.dimensions)
         self.shape = self._var.shape
-        self.scale = True
+        self.mask = grp._auto_mask
+        self.scale = grp._auto_scale
+        # Parsed on first use, see _packing:
+        self._parsed_packing = None
         self.name = name
         self.size = np.prod(self.shape)
         return
@@ -280,6 +353,13 @@ class Variable:
     def getValue(self):
         return self._var[...]
 
+    def _array_proxy(self):
+        # Grids are read through their array:
+        data = getattr(self._var, 'array', self._var).data
+        if not isinstance(data, proxy.ArrayProxy):
+            raise TypeError('Variable %s cannot be read by hyperslabs' % self.name)
+        return data
+
     def group(self):
         return self._grp
 
@@ -293,25 +373,49 @@ class Variable:
             return unicode(self).encode(default_encoding)
 
     def __getitem__(self, getitem_tuple):
+        return self._unpack(self._getitem(getitem_tuple))
+
+    def _unpack(self, data):
+        # Mask and scale data read from the variable, when turned on:
+        packing = self._active_packing()
+        if packing is None:
+            return data
+        return packing.unpack(data, self.mask, self.scale)
+
+    def _getitem(self, getitem_tuple):
         try:
             try:
                 return self._var.array.__getitem__(getitem_tuple)
             except (AttributeError, ServerError, requests.exceptions.HTTPError) as e:
+                if (isinstance(e, requests.exceptions.HTTPError) and
+                    str(e).startswith('40')):
+                    raise
                 if ( 
                      isinstance(getitem_tuple, slice) and
                      getitem_tuple == _PhonyVariable()[:]):
                     #A single dimension ellipsis was requested. Use netCDF4 convention:
-                    return self[...]
+                    return self._getitem(Ellipsis)
                 else:
                     return self._var.__getitem__(getitem_tuple)
         except requests.exceptions.HTTPError as e:
-            if str(e).startswith('40'):
-                # 400 type error. Try to authenticate:
-                _authenticate_or_raise(self._grp.assign_pydap_instance,
-                                       authenticate=True)
-                return self.__getitem__(getitem_tuple)
-            else:
-                raise ServerError(str(e))
+            # 400 type errors were already retried with refreshed credentials
+            # by the data request:
+            raise ServerError(str(e))
+
+    def read_into(self, out, index=Ellipsis):
+        """
+        Read `index` into the writable array or buffer `out`, e.g. a
+        numpy.memmap, without allocating the result, and return `out`.
+        Values are decoded from the responses directly into `out`, tile by
+        tile, see ArrayProxy.read_into. Values are neither masked nor
+        scaled.
+        """
+        try:
+            return self._array_proxy().read_into(out, index)
+        except requests.exceptions.HTTPError as e:
+            # 400 type errors were already retried with refreshed credentials
+            # by the data request:
+            raise ServerError(str(e))
 
     def __len__(self):
         if not self.shape:
@@ -319,14 +423,78 @@ class Variable:
         else:
             return self.shape[0]
 
+    # Reductions read the variable block by block instead of as a whole,
+    # see netcdf4_pydap.reductions:
+    def sum(self, axis=None, block_size=reductions.BLOCK_SIZE, max_workers=1):
+        return self._reduce(reductions.reduce, 'sum', axis=axis,
+                            block_size=block_size, max_workers=max_workers)
+
+    def mean(self, axis=None, block_size=reductions.BLOCK_SIZE, max_workers=1):
+        return self._reduce(reductions.reduce, 'mean', axis=axis,
+                            block_size=block_size, max_workers=max_workers)
+
+    def min(self, axis=None, block_size=reductions.BLOCK_SIZE, max_workers=1):
+        return self._reduce(reductions.reduce, 'min', axis=axis,
+                            block_size=block_size, max_workers=max_workers)
+
+    def max(self, axis=None, block_size=reductions.BLOCK_SIZE, max_workers=1):
+        return self._reduce(reductions.reduce, 'max', axis=axis,
+                            block_size=block_size, max_workers=max_workers)
+
+    def count(self, axis=None, block_size=reductions.BLOCK_SIZE, max_workers=1):
+        """
+        Number of values that are not missing.
+        """
+        return self._reduce(reductions.reduce, 'count', axis=axis,
+                            block_size=block_size, max_workers=max_workers)
+
+    def histogram(self, bins=10, range=None, block_size=reductions.BLOCK_SIZE,
+                  max_workers=1):
+        return self._reduce(reductions.histogram, bins=bins, range=range,
+                            block_size=block_size, max_workers=max_workers)
+
+    def to_dask(self, chunks=None, target_size=64 * 2**20):
+        """
+        Return a lazy dask array whose chunks are read by hyperslabs,
+        see netcdf4_pydap.dask_array.to_dask. Requires dask.
+        """
+        from .dask_array import to_dask
+        return to_dask(self, chunks=chunks, target_size=target_size)
+
+    def _reduce(self, function, *args, **kwargs):
+        try:
+            return function(self, *args, **kwargs)
+        except requests.exceptions.HTTPError as e:
+            # 400 type errors were already retried with refreshed credentials
+            # by the data request:
+            raise ServerError(str(e))
+
     def set_auto_maskandscale(self, maskandscale):
-        raise NotImplementedError('set_auto_maskandscale is not implemented for pydap')
+        """
+        Turn on or off masking of missing values and unpacking with
+        scale_factor and add_offset, as in netCDF4-python. Both are off
+        by default.
+        """
+        self.set_auto_mask(maskandscale)
+        self.set_auto_scale(maskandscale)
 
     def set_auto_scale(self, scale):
-        raise NotImplementedError('set_auto_scale is not implemented for pydap')
+        self.scale = bool(scale)
 
     def set_auto_mask(self, mask):
-        raise NotImplementedError('set_auto_mask is not implemented for pydap')
+        self.mask = bool(mask)
+
+    def _packing(self):
+        # The attributes are parsed once per variable:
+        if self._parsed_packing is None:
+            self._parsed_packing = Packing(self)
+        return self._parsed_packing
+
+    def _active_packing(self):
+        # The packing applied to reads, or None:
+        if not (self.mask or self.scale) or self.dtype.kind not in 'biuf':
+            return None
+        return self._packing()
 
     def __unicode__(self):
         #taken directly from netcdf4-python: netCDF4.pyx
@@ -401,6 +569,38 @@ def _authenticate_or_raise(fcn_handle, authenticate=False):
             raise ServerError(str(e))
 
 
+class _LazyMapping(collections.Mapping):
+    """
+    An ordered mapping whose values are built on first access.
+    """
+    def __init__(self, keys, factory):
+        self._keys = list(keys)
+        self._key_set = set(self._keys)
+        self._factory = factory
+        self._values = dict()
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            if key not in self._key_set:
+                raise
+        value = self._values[key] = self._factory(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self._key_set
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return repr(OrderedDict(self.items()))
+
+
 class _PhonyVariable:
     #A phony variable to translate getitems:
     def __init__(self):
@@ -0,0 +1,187 @@
+"""
+Dask arrays of remote variables.
+
+Each chunk of the dask array is a hyperslab read through ArrayProxy. The
+graph holds a small picklable source with the url, the variable name and
+the configuration of the Dataset, not its session: the dataset is opened
+again, once per process, by the first task that reads it. Sources with the
+same url and configuration share that dataset, which is closed when the
+process exits.
+
+A session passed to the Dataset is not used by the tasks; credentials are
+taken from the username, password, authentication_url or cookie_store of
+the Dataset. A password is therefore pickled, in plain text, into every
+task of the graph and sent to the workers of distributed schedulers.
+Prefer a cookie_store shared with the workers, which only holds session
+cookies.
+
+Chunks are masked and scaled as the variable was set to read them when
+to_dask was called, see Variable.set_auto_maskandscale.
+
+dask is an optional dependency, imported by to_dask.
+"""
+
+import os
+import uuid
+import atexit
+import hashlib
+import threading
+import cPickle as pickle
+
+import numpy as np
+
+from . import core
+
+__all__ = ['to_dask']
+
+TARGET_SIZE = 64 * 2**20
+
+# Dataset arguments carried by the graph:
+_CONFIG = ('cache', 'expire_after', 'timeout', 'username', 'password',
+           'authentication_url', 'use_certificates', 'keep_alive',
+           'pool_maxsize', 'max_workers', 'max_tile_size', 'metadata_cache',
+           'cookie_store', 'retry', 'compression')
+
+# Datasets opened by the tasks, by url, configuration and process:
+_datasets = dict()
+_datasets_lock = threading.Lock()
+
+
+@atexit.register
+def _close_datasets():
+    with _datasets_lock:
+        for key in list(_datasets):
+            if key[-1] == os.getpid():
+                _datasets.pop(key).close()
+
+
+def to_dask(variable, chunks=None, target_size=TARGET_SIZE):
+    """
+    Return a lazy dask array of a core.Variable.
+
+    Parameters
+    ----------
+
+    variable : core.Variable
+    chunks : int, tuple or str, optional
+        Chunks of the dask array, as in dask.array.from_array.
+        Default: chunks of at most `target_size` bytes, when possible,
+        that split the variable along its leading dimensions.
+    target_size : int, optional
+        Size in bytes of the default chunks.
+        Default: 64 MB.
+    """
+    import dask.array
+    from dask.base import tokenize
+
+    # Raises TypeError for variables that are not read by hyperslabs:
+    variable._array_proxy()
+    dataset = variable.group()
+    config = dict((name, getattr(dataset, name)) for name in _CONFIG)
+    packing = variable._active_packing()
+    mask = packing is not None and variable.mask
+    scale = packing is not None and variable.scale
+    if scale:
+        dtype = packing.unpacked_dtype
+    elif mask:
+        dtype = packing.dtype
+    else:
+        dtype = variable.dtype
+    source = _Source(dataset.filepath(), variable.name, variable.shape,
+                     dtype, config, mask=mask, scale=scale)
+    if chunks is None:
+        chunks = default_chunks(variable.shape, dtype.itemsize, target_size)
+    name = 'netcdf4_pydap-' + tokenize(source.url, source.name, chunks,
+                                       mask, scale)
+    # Masked chunks are not converted to plain arrays:
+    return dask.array.from_array(source, chunks=chunks, name=name,
+                                 asarray=not mask)
+
+
+def default_chunks(shape, itemsize, target_size=TARGET_SIZE):
+    """
+    Chunks that keep the trailing dimensions whole and split the leading
+    dimensions so that chunks are at most `target_size` bytes, if possible.
+    """
+    chunks = list(shape)
+    size = itemsize
+    for axis in range(len(shape) - 1, -1, -1):
+        if size * shape[axis] > target_size:
+            chunks[axis] = max(1, target_size // size)
+            chunks[:axis] = [1] * axis
+            break
+        size *= shape[axis]
+    return tuple(chunks)
+
+
+class _Source(object):
+    """
+    A picklable array-like that reads a variable of a dataset.
+    """
+    def __init__(self, url, name, shape, dtype, config, mask=False,
+                 scale=False):
+        self.url = url
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.ndim = len(self.shape)
+        self.config = config
+        self.mask = mask
+        self.scale = scale
+        # Identifies the dataset of this source once unpickled:
+        self.token = _config_token(url, config)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        out_shape = _slices_shape(key, self.shape)
+        if out_shape is not None and 0 in out_shape:
+            # Dask slices empty arrays to find their type:
+            return np.empty(out_shape, dtype=self.dtype)
+        variable = self._dataset().variables[self.name]
+        # The shared variable reads raw values, unpacked as this source was:
+        result = variable._getitem(key)
+        if self.mask or self.scale:
+            result = variable._packing().unpack(result, self.mask, self.scale)
+        # Integers drop their axis, as dask expects from numpy:
+        axis = tuple(position for position, item in enumerate(key)
+                     if isinstance(item, (int, long, np.integer)))
+        if axis:
+            result = np.squeeze(result, axis)
+        return result
+
+    def _dataset(self):
+        # Datasets are not shared with forked processes:
+        key = (self.token, os.getpid())
+        with _datasets_lock:
+            if key not in _datasets:
+                _datasets[key] = core.Dataset(self.url, **self.config)
+            return _datasets[key]
+
+    def __repr__(self):
+        return '<%s %s of %s>' % (self.__class__.__name__, self.name,
+                                  self.url)
+
+
+def _config_token(url, config):
+    """
+    A token equal for sources with equal urls and configurations.
+    """
+    try:
+        state = pickle.dumps((url, sorted(config.items())),
+                             pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError):
+        # Such a source is only read in this process, by threads:
+        return uuid.uuid4().hex
+    return hashlib.sha1(state).hexdigest()
+
+
+def _slices_shape(key, shape):
+    """
+    Shape selected by a tuple of slices, or None if it has other items.
+    """
+    if not all(isinstance(item, slice) for item in key):
+        return None
+    key = key + (slice(None),) * (len(shape) - len(key))
+    return tuple(len(xrange(*item.indices(length)))
+                 for item, length in zip(key, shape))
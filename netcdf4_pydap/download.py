@@ -0,0 +1,220 @@
+"""
+Download many files with httpserver.Dataset.
+
+Files are downloaded concurrently, with a limit on the number of
+simultaneous downloads from each host. One session is created per host
+and shared by its downloads, so that authentication cookies are reused.
+Destinations that already exist are skipped: downloads are written to a
+temporary file that is renamed once complete.
+
+Usage: netcdf4_pydap_download [options] manifest
+
+The manifest lists one url and its destination per line.
+"""
+
+import os
+import sys
+import time
+import getpass
+import argparse
+import threading
+from urlparse import urlsplit
+from collections import OrderedDict
+
+from . import sessions
+from .httpserver import Dataset
+from ._pool import thread_map
+
+__all__ = ['download', 'read_manifest', 'DownloadReport']
+
+
+class DownloadReport(object):
+    """
+    Outcome of a bulk download.
+    """
+    def __init__(self):
+        self.downloaded = []
+        self.skipped = []
+        self.failed = []
+        self.size = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def _add(self, outcome, dest_name, size=0):
+        with self._lock:
+            getattr(self, outcome).append(dest_name)
+            self.size += size
+
+    @property
+    def throughput(self):
+        """
+        Bytes downloaded per second.
+        """
+        if not self.elapsed:
+            return 0.0
+        return self.size / self.elapsed
+
+    def __str__(self):
+        return ('%d downloaded, %d skipped, %d failed: '
+                '%.1f MB in %.1f s (%.2f MB/s)' %
+                (len(self.downloaded), len(self.skipped), len(self.failed),
+                 self.size / 2.0**20, self.elapsed,
+                 self.throughput / 2.0**20))
+
+
+def download(manifest, max_workers=8, max_per_host=2, max_connections=1,
+             range_size=16 * 2**20, session=None, **kwargs):
+    """
+    Download the files of a manifest.
+
+    Parameters
+    ----------
+
+    manifest : list of (str, str)
+        Pairs of urls and destinations.
+    max_workers : int, optional
+        Number of files downloaded simultaneously.
+        Default: 8.
+    max_per_host : int, optional
+        Number of files downloaded simultaneously from each host.
+        Default: 2.
+    max_connections : int, optional
+        Number of connections per file, see httpserver.Dataset.wget.
+        Default: 1.
+    range_size : int, optional
+        Size of the ranges of files downloaded over several connections.
+        Default: 16 MB.
+    session : requests.Session, optional
+        Session used for all hosts.
+        Default: one new session per host.
+    kwargs :
+        Passed to httpserver.Dataset, e.g. credentials.
+
+    Returns
+    -------
+
+    DownloadReport. Failed downloads are listed as (destination, error)
+    pairs; they do not interrupt the other downloads.
+    """
+    report = DownloadReport()
+    start = time.time()
+
+    by_host = OrderedDict()
+    for url, dest_name in manifest:
+        if os.path.exists(dest_name):
+            report._add('skipped', dest_name)
+        else:
+            by_host.setdefault(urlsplit(url).netloc, []).append(
+                (url, dest_name))
+
+    host_sessions = dict()
+    host_slots = dict()
+    for host in by_host:
+        if session is None:
+            host_sessions[host] = sessions.create_single_session(
+                pool_maxsize=max_per_host * max_connections)
+        else:
+            host_sessions[host] = session
+        host_slots[host] = threading.BoundedSemaphore(max_per_host)
+
+    def fetch(item):
+        host, url, dest_name = item
+        with host_slots[host]:
+            dataset = Dataset(url, session=host_sessions[host], **kwargs)
+            try:
+                # wget sends the first request itself, under its retry policy:
+                dataset.wget(dest_name, max_connections=max_connections,
+                             range_size=range_size)
+            except Exception as e:
+                with report._lock:
+                    report.failed.append((dest_name, e))
+            else:
+                report._add('downloaded', dest_name,
+                            os.path.getsize(dest_name))
+            finally:
+                dataset.close()
+
+    try:
+        thread_map(fetch, _interleave(by_host), max_workers)
+    finally:
+        if session is None:
+            for host_session in host_sessions.values():
+                host_session.close()
+    report.elapsed = time.time() - start
+    return report
+
+
+def _interleave(by_host):
+    """
+    Order downloads in turn from each host, so that workers are not all
+    waiting for the same host.
+    """
+    out = []
+    queues = [(host, list(items)) for host, items in by_host.items()]
+    while queues:
+        for host, items in queues:
+            url, dest_name = items.pop(0)
+            out.append((host, url, dest_name))
+        queues = [(host, items) for host, items in queues if items]
+    return out
+
+
+def read_manifest(manifest_file):
+    """
+    Read (url, destination) pairs from a file with one pair per line.
+    Blank lines and lines starting with # are ignored.
+    """
+    manifest = []
+    for line in manifest_file:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        url, dest_name = line.split(None, 1)
+        manifest.append((url, dest_name))
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Download the files listed in a manifest of '
+                    '"url destination" lines.')
+    parser.add_argument('manifest', help='Manifest file, - for stdin.')
+    parser.add_argument('--max-workers', type=int, default=8,
+                        help='Files downloaded simultaneously.')
+    parser.add_argument('--max-per-host', type=int, default=2,
+                        help='Files downloaded simultaneously from a host.')
+    parser.add_argument('--max-connections', type=int, default=1,
+                        help='Connections per file, for servers that '
+                             'accept range requests.')
+    parser.add_argument('--authentication-url',
+                        help='Url of the authentication service. '
+                             'The password is prompted for.')
+    parser.add_argument('--username')
+    parser.add_argument('--use-certificates', action='store_true',
+                        help='Use the certificates in X509_USER_PROXY.')
+    args = parser.parse_args(argv)
+
+    if args.manifest == '-':
+        manifest = read_manifest(sys.stdin)
+    else:
+        with open(args.manifest) as manifest_file:
+            manifest = read_manifest(manifest_file)
+
+    password = None
+    if args.authentication_url is not None:
+        password = getpass.getpass('Password: ')
+
+    report = download(manifest, max_workers=args.max_workers,
+                      max_per_host=args.max_per_host,
+                      max_connections=args.max_connections,
+                      authentication_url=args.authentication_url,
+                      username=args.username, password=password,
+                      use_certificates=args.use_certificates)
+    for dest_name, error in report.failed:
+        sys.stderr.write('Failed: %s: %s\n' % (dest_name, error))
+    print(report)
+    return 1 if report.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,15 +5,23 @@ files using wget.
 
 #External:
 import os
+import sys
+import json
+import tempfile
+import threading
+import contextlib
 from socket import error as SocketError
 import warnings
 import requests
 import requests_cache
 import datetime
+import six
 
 #Internal:
 from . import sessions
+from . import retries
 from .cas import get_cookies
+from ._pool import thread_map
 
 class Dataset:
     def __init__(self,url,
@@ -25,7 +33,8 @@ class Dataset:
                  authentication_url=None,
                  username=None,
                  password=None,
-                 use_certificates=False):
+                 use_certificates=False,
+                 retry=None):
         self._url=url
         self.timeout=timeout
         self.cache=cache
@@ -35,13 +44,14 @@ class Dataset:
         self.username=username
         self.password=password
         self.use_certificates=use_certificates
+        self.retry=retry
 
         if (isinstance(self.passed_session,requests.Session) or
             isinstance(self.passed_session,requests_cache.core.CachedSession)
             ):
             self.session=self.passed_session
         else:
-            self.session=requests_sessions.create_single_session(cache=self.cache,expire_after=self.expire_after)
+            self.session=sessions.create_single_session(cache=self.cache,expire_after=self.expire_after)
 
         self._is_initiated=False
         return
@@ -116,20 +126,147 @@ class Dataset:
         self._is_initiated=True
         return self
 
-    def wget(self,dest_name,progress=False,block_sz=8192):
+    def wget(self,dest_name,progress=False,block_sz=8192,
+             max_connections=1,range_size=16 * 2**20):
+        """
+        Download the file to `dest_name`.
+
+        With `max_connections` > 1, files served with byte ranges are
+        downloaded in ranges of `range_size` bytes over several
+        connections. Completed ranges are recorded in `dest_name + '.state'`
+        so that an interrupted download resumes where it stopped. Other
+        files are downloaded in a single stream.
+
+        Failed downloads are retried according to the retry policy. A
+        ranged download is resumed at its first incomplete range.
+        """
+        was_initiated=self._is_initiated
+        with _cache_disabled(self.session):
+            try:
+                return retries.call(self.retry,self._url,
+                                    lambda: self._attempt_wget(dest_name,progress,block_sz,
+                                                               max_connections,range_size))
+            finally:
+                if not was_initiated and self._is_initiated:
+                    self.response.close()
+                    self._is_initiated=False
+
+    def _attempt_wget(self,dest_name,progress,block_sz,max_connections,range_size):
         if not self._is_initiated:
-            if isinstance(self.session,requests_cache.core.CachedSession):
-                with self.session.cache_disabled():
-                    self._initiate_query()
-                    size_string=self._initiated_wget(dest_name,progress=progress,block_sz=block_size)
-            else:
-                self._initiate_query()
-                size_string=self._initiated_wget(dest_name,progress=progress,block_sz=block_size)
+            self._initiate_query()
+        try:
+            return self._download(dest_name,progress,block_sz,
+                                  max_connections,range_size)
+        except:
+            #A retry starts with a new response:
             self.response.close()
             self._is_initiated=False
-            return size_string
-        else:
-            return self._initiated_wget(dest_name,progress=progress,block_sz=block_sz)
+            raise
+
+    def _download(self,dest_name,progress,block_sz,max_connections,range_size):
+        #Do not save error pages:
+        self.response.raise_for_status()
+        if max_connections>1 and _accepts_ranges(self.response):
+            #The ranges are requested separately:
+            self.response.close()
+            return self._ranged_wget(dest_name,max_connections,range_size)
+        return self._initiated_wget(dest_name,progress=progress,block_sz=block_sz)
+
+    def _ranged_wget(self,dest_name,max_connections,range_size):
+        directory=os.path.dirname(dest_name)
+        if directory!='' and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        file_size=int(self.response.headers['Content-Length'])
+        size_string="Downloading: %s MB: %s" % (dest_name, file_size/2.0**20)
+
+        #A download is resumed only if the file did not change:
+        validator={'url': self._url,
+                   'size': file_size,
+                   'etag': self.response.headers.get('ETag'),
+                   'last_modified': self.response.headers.get('Last-Modified'),
+                   'range_size': range_size}
+        part_name=dest_name+'.part'
+        state_name=dest_name+'.state'
+        state=_load_state(state_name)
+        if (state is None or state['validator']!=validator or
+            not os.path.exists(part_name)):
+            state={'validator': validator, 'done': []}
+            with open(part_name,'wb') as part_file:
+                part_file.truncate(file_size)
+            _save_state(state_name,state)
+
+        done=set(state['done'])
+        pending=[(start,min(start+range_size,file_size))
+                 for start in xrange(0,file_size,range_size)
+                 if start not in done]
+        #Ranges are requested from the url reached after redirections:
+        url=self.response.url
+        lock=threading.Lock()
+        errors=[]
+
+        def fetch(byte_range):
+            #After a failure, the remaining ranges are left for a retry:
+            if errors:
+                return
+            try:
+                self._fetch_range(url,part_name,byte_range,validator['etag'])
+            except Exception:
+                errors.append(sys.exc_info())
+                return
+            with lock:
+                state['done'].append(byte_range[0])
+                _save_state(state_name,state)
+
+        thread_map(fetch,pending,max_connections)
+        if errors:
+            six.reraise(*errors[0])
+        os.rename(part_name,dest_name)
+        os.remove(state_name)
+        return size_string
+
+    def _fetch_range(self,url,part_name,byte_range,etag):
+        start,stop=byte_range
+        headers={'connection': 'keep-alive',
+                 'Range': 'bytes=%d-%d' % (start,stop-1)}
+        if etag is not None:
+            headers['If-Range']=etag
+        response=self._get(url,headers)
+        try:
+            response.raise_for_status()
+            if response.status_code!=206:
+                #The file changed or ranges are not supported anymore:
+                raise IOError('Range request on {0} returned status {1}'
+                              .format(url,response.status_code))
+            size=0
+            with open(part_name,'r+b') as part_file:
+                part_file.seek(start)
+                for buffer in response.iter_content(2**20):
+                    part_file.write(buffer)
+                    size+=len(buffer)
+            if size!=stop-start:
+                raise IOError('Range {0}-{1} of {2} is incomplete'
+                              .format(start,stop-1,url))
+        finally:
+            response.close()
+
+    def _get(self,url,headers):
+        if self.use_certificates:
+            X509_PROXY=os.environ['X509_USER_PROXY']
+            with warnings.catch_warnings():
+                warnings.filterwarnings('ignore', message='Unverified HTTPS request is being made. Adding certificate verification is strongly advised. See: https://urllib3.readthedocs.org/en/latest/security.html')
+                return self.session.get(url,
+                            cert=(X509_PROXY,X509_PROXY),
+                            verify=False,
+                            headers=headers,
+                            allow_redirects=True,
+                            timeout=self.timeout,
+                            stream=True)
+        return self.session.get(url,
+                                headers=headers,
+                                allow_redirects=True,
+                                timeout=self.timeout,
+                                stream=True)
 
     def _initiated_wget(self,dest_name,progress=False,block_sz=8192):
         directory=os.path.dirname(dest_name)
@@ -146,7 +283,10 @@ class Dataset:
         else:
             size_string="Downloading: %s MB: Unknown" % (dest_name)
 
-        with open(dest_name, 'wb') as dest_file:
+        #The file is renamed once complete, so that an existing
+        #destination is always a complete download:
+        part_name=dest_name+'.part'
+        with open(part_name, 'wb') as dest_file:
             file_size_dl = 0
             for buffer in self.response.iter_content(block_sz):
                 dest_file.write(buffer)
@@ -154,6 +294,7 @@ class Dataset:
                     file_size_dl += len(buffer)
                     status = r"%10d  [%3.2f%%]" % (file_size_dl, file_size_dl * 100. / file_size)
                     status = status + chr(8)*(len(status)+1)
+        os.rename(part_name,dest_name)
         return size_string
 
     def __exit__(self,type,value,traceback):
@@ -170,6 +311,35 @@ class Dataset:
             self.session.close()
         return
 
+@contextlib.contextmanager
+def _cache_disabled(session):
+    #Disable cache for streaming and range requests:
+    if isinstance(session,requests_cache.core.CachedSession):
+        with session.cache_disabled():
+            yield
+    else:
+        yield
+
+def _accepts_ranges(response):
+    return (response.headers.get('Accept-Ranges','').lower()=='bytes' and
+            'Content-Length' in response.headers and
+            response.headers.get('Content-Encoding','identity')=='identity')
+
+def _load_state(state_name):
+    try:
+        with open(state_name) as state_file:
+            return json.load(state_file)
+    except (IOError,ValueError):
+        return None
+
+def _save_state(state_name,state):
+    #Written atomically so that an interrupted download leaves a valid state:
+    handle,temp_name=tempfile.mkstemp(dir=os.path.dirname(state_name) or '.',
+                                      suffix='.tmp')
+    with os.fdopen(handle,'w') as state_file:
+        json.dump(state,state_file)
+    os.rename(temp_name,state_name)
+
 class RemoteEmptyError(Exception):
     def __init__(self, value):
         self.value = value
@@ -0,0 +1,153 @@
+"""
+Masking and unpacking of variables, with the semantics of netCDF4-python.
+
+The attributes of a variable are parsed once, into a Packing. Masking
+compares the packed values with the fill and missing values and the valid
+range, accumulating into a single boolean mask. Unpacking converts packed
+integers to floats in one pass and scales them in place.
+"""
+
+import numpy as np
+from netCDF4 import default_fillvals
+
+__all__ = ['Packing']
+
+
+class Packing(object):
+    """
+    The _FillValue, missing_value, valid_range, valid_min, valid_max,
+    scale_factor, add_offset and _Unsigned attributes of a variable.
+    """
+    def __init__(self, variable):
+        attributes = dict((name, variable.getncattr(name))
+                          for name in variable.ncattrs())
+        dtype = variable.dtype
+        self.unsigned = (dtype.kind == 'i' and
+                         str(attributes.get('_Unsigned', 'false')).lower() == 'true')
+        if self.unsigned:
+            dtype = np.dtype('u%d' % dtype.itemsize)
+        self.dtype = dtype
+        self.maskable = dtype.kind in 'biuf'
+
+        missing = []
+        for name in ('_FillValue', 'missing_value'):
+            if name in attributes:
+                missing.extend(np.ravel(attributes[name]))
+        if ('_FillValue' not in attributes and dtype.kind in 'iuf' and
+            dtype.itemsize > 1):
+            # Default netCDF fill value, as netCDF4-python:
+            missing.append(default_fillvals[dtype.str[1:]])
+        # NaN is masked by comparison with itself:
+        self.missing = [_cast(value, dtype) for value in missing
+                        if not _isnan(value)]
+
+        self.valid_min = self.valid_max = None
+        if 'valid_range' in attributes:
+            self.valid_min, self.valid_max = [
+                _cast(value, dtype) for value in attributes['valid_range']]
+        if 'valid_min' in attributes:
+            self.valid_min = _cast(attributes['valid_min'], dtype)
+        if 'valid_max' in attributes:
+            self.valid_max = _cast(attributes['valid_max'], dtype)
+
+        self.scale_factor = attributes.get('scale_factor')
+        self.add_offset = attributes.get('add_offset')
+        self.scaled = (self.scale_factor is not None or
+                       self.add_offset is not None)
+        if self.scaled:
+            factors = [np.asarray(value).dtype
+                       for value in (self.scale_factor, self.add_offset)
+                       if value is not None]
+            self.unpacked_dtype = np.result_type(*factors)
+            if self.unpacked_dtype.kind != 'f':
+                self.unpacked_dtype = np.dtype(np.float64)
+        else:
+            self.unpacked_dtype = dtype
+
+    def packed(self, data):
+        """
+        The data with the signedness given by _Unsigned.
+        """
+        if self.unsigned and data.dtype.kind == 'i':
+            return data.view(data.dtype.str.replace('i', 'u'))
+        return data
+
+    def invalid(self, data):
+        """
+        Boolean mask of the packed values that are missing, or None if
+        there are none.
+        """
+        if not self.maskable:
+            return None
+        mask = None
+        # Comparisons are written into a reused scratch array:
+        scratch = None
+        comparisons = [(np.equal, value) for value in self.missing]
+        if self.valid_min is not None:
+            comparisons.append((np.less, self.valid_min))
+        if self.valid_max is not None:
+            comparisons.append((np.greater, self.valid_max))
+        for function, value in comparisons:
+            if mask is None:
+                mask = function(data, value)
+            else:
+                scratch = function(data, value, out=scratch)
+                mask |= scratch
+        if data.dtype.kind == 'f':
+            if mask is None:
+                mask = np.isnan(data)
+            else:
+                scratch = np.isnan(data, out=scratch)
+                mask |= scratch
+        if mask is None or not mask.any():
+            return None
+        return mask
+
+    def mask(self, data):
+        """
+        Masked array of the data, as netCDF4-python returns it. Without
+        missing values the mask is not allocated.
+        """
+        data = self.packed(data)
+        mask = self.invalid(data)
+        if mask is None:
+            mask = np.ma.nomask
+        return np.ma.masked_array(data, mask)
+
+    def unpack(self, data, mask=True, scale=True):
+        """
+        Mask and scale data read from the variable, as requested.
+        """
+        data = np.asanyarray(data)
+        if mask:
+            data = self.mask(data)
+        if scale:
+            data = self.scale(data)
+        return data
+
+    def scale(self, data):
+        """
+        Unpack with scale_factor and add_offset, in place when the data
+        is writable and has the unpacked type.
+        """
+        data = self.packed(data)
+        if not self.scaled:
+            return data
+        writable = (np.ma.getdata(data).flags.writeable and
+                    data.dtype == self.unpacked_dtype)
+        if not writable:
+            data = data.astype(self.unpacked_dtype)
+        if self.scale_factor is not None:
+            data *= self.scale_factor
+        if self.add_offset is not None:
+            data += self.add_offset
+        return data
+
+
+def _isnan(value):
+    return isinstance(value, (float, np.floating)) and np.isnan(value)
+
+
+def _cast(value, dtype):
+    # Attributes are compared at the precision of the data:
+    return np.asarray(value).astype(dtype)[()]
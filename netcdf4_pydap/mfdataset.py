@@ -0,0 +1,323 @@
+"""
+Aggregation of several OPeNDAP datasets along a record dimension,
+in the manner of netCDF4.MFDataset.
+
+Member datasets are opened concurrently. Variables that have the
+aggregation dimension as their first dimension are presented as a single
+variable; reads that span several members are sent to the members
+concurrently and stitched into one array. Other variables are read from
+the first member.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from . import core
+from ._pool import thread_map
+from .requests_pydap import proxy
+
+__all__ = ['MFDataset']
+
+
+class MFDataset(object):
+    """
+    Open several datasets as one.
+
+    Parameters
+    ----------
+
+    urls : list of str
+        Urls of the members, in the order of the aggregation dimension.
+    aggdim : str, optional
+        Aggregation dimension.
+        Default: the unlimited dimension of the first member.
+    max_workers : int, optional
+        Number of members opened or read concurrently.
+        Default: 8.
+    kwargs :
+        Passed to netcdf4_pydap.Dataset.
+    """
+    def __init__(self, urls, aggdim=None, max_workers=8, **kwargs):
+        if not urls:
+            raise ValueError('MFDataset requires at least one url')
+        self._urls = list(urls)
+        self.max_workers = max_workers
+        self._datasets = _open_all(self._urls, max_workers, kwargs)
+        try:
+            self.aggdim = _check_members(self._datasets, self._urls, aggdim)
+        except:
+            self.close()
+            raise
+
+        first = self._datasets[0]
+        lengths = [len(dataset.dimensions[self.aggdim])
+                   for dataset in self._datasets]
+        self._offsets = np.cumsum([0] + lengths)
+
+        self.dimensions = OrderedDict()
+        for name in first.dimensions:
+            dimension = first.dimensions[name]
+            if name == self.aggdim:
+                dimension = core.Dimension(self, name,
+                                           size=int(self._offsets[-1]),
+                                           isunlimited=dimension.isunlimited())
+            self.dimensions[name] = dimension
+
+        self.variables = OrderedDict()
+        for name in first.variables:
+            var = first.variables[name]
+            if var.dimensions[:1] == (self.aggdim,):
+                var = _Variable(self, name)
+            self.variables[name] = var
+
+        self.data_model = first.data_model
+        self.file_format = first.file_format
+        self.disk_format = first.disk_format
+        self.path = '/'
+        self.parent = None
+        self.groups = OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, atype, value, traceback):
+        self.close()
+
+    def __getitem__(self, name):
+        return self.variables[name]
+
+    def filepath(self):
+        return self._urls
+
+    def close(self):
+        for dataset in self._datasets:
+            dataset.close()
+
+    def isopen(self):
+        return all(dataset.isopen() for dataset in self._datasets)
+
+    def set_auto_maskandscale(self, flag):
+        for dataset in self._datasets:
+            dataset.set_auto_maskandscale(flag)
+
+    def set_auto_mask(self, flag):
+        for dataset in self._datasets:
+            dataset.set_auto_mask(flag)
+
+    def set_auto_scale(self, flag):
+        for dataset in self._datasets:
+            dataset.set_auto_scale(flag)
+
+    def ncattrs(self):
+        return self._datasets[0].ncattrs()
+
+    def getncattr(self, attr):
+        return self._datasets[0].getncattr(attr)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self.getncattr(name)
+        except KeyError:
+            raise AttributeError(name)
+
+    def __repr__(self):
+        return ('<%s of %d datasets aggregated along %s: %s>' %
+                (self.__class__.__name__, len(self._datasets), self.aggdim,
+                 ', '.join(self.variables.keys())))
+
+
+class _Variable(object):
+    """
+    A variable aggregated along the first dimension.
+    """
+    def __init__(self, group, name):
+        self._grp = group
+        self._members = [dataset.variables[name]
+                         for dataset in group._datasets]
+        first = self._members[0]
+        self.name = name
+        self.dimensions = first.dimensions
+        self.dtype = first.dtype
+        self.datatype = first.datatype
+        self.ndim = first.ndim
+        self.shape = (len(group.dimensions[group.aggdim]),) + first.shape[1:]
+        self.size = np.prod(self.shape)
+
+    def group(self):
+        return self._grp
+
+    def ncattrs(self):
+        return self._members[0].ncattrs()
+
+    def getncattr(self, attr):
+        return self._members[0].getncattr(attr)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self.getncattr(name)
+        except KeyError:
+            raise AttributeError(name)
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def mask(self):
+        return self._members[0].mask
+
+    @property
+    def scale(self):
+        return self._members[0].scale
+
+    def set_auto_maskandscale(self, maskandscale):
+        for member in self._members:
+            member.set_auto_maskandscale(maskandscale)
+
+    def set_auto_mask(self, mask):
+        for member in self._members:
+            member.set_auto_mask(mask)
+
+    def set_auto_scale(self, scale):
+        for member in self._members:
+            member.set_auto_scale(scale)
+
+    def __array__(self):
+        return self[...]
+
+    def __getitem__(self, getitem_tuple):
+        key = _expand(getitem_tuple, self.ndim)
+        indices = _indices(key[0], self.shape[0])
+        offsets = self._grp._offsets
+
+        # Indices falling in each member and their position in the output:
+        reads = []
+        for member, start, stop in zip(self._members, offsets[:-1],
+                                       offsets[1:]):
+            positions = np.nonzero((indices >= start) & (indices < stop))[0]
+            if len(positions):
+                reads.append((member, indices[positions] - start, positions))
+        if not reads:
+            return self._members[0][(np.array([], dtype=int),) + key[1:]]
+
+        values = [None] * len(reads)
+
+        def read(position):
+            member, local, dummy = reads[position]
+            values[position] = member[(_local_index(local),) + key[1:]]
+
+        thread_map(read, range(len(reads)), self._grp.max_workers)
+        if len(reads) == 1 and len(reads[0][2]) == len(indices):
+            return values[0]
+
+        shape = (len(indices),) + values[0].shape[1:]
+        dtype = np.result_type(*values)
+        if any(np.ma.isMaskedArray(value) for value in values):
+            # Masked members keep their mask:
+            out = np.ma.masked_array(np.empty(shape, dtype=dtype), mask=False)
+        else:
+            out = np.empty(shape, dtype=dtype)
+        for (member, local, positions), value in zip(reads, values):
+            out[positions] = value
+        return out
+
+    def __repr__(self):
+        return ('<%s %s%s aggregated along %s>' %
+                (self.__class__.__name__, self.name, self.shape,
+                 self._grp.aggdim))
+
+
+def _open_all(urls, max_workers, kwargs):
+    datasets = [None] * len(urls)
+
+    def open_dataset(position):
+        datasets[position] = core.Dataset(urls[position], **kwargs)
+
+    try:
+        thread_map(open_dataset, range(len(urls)), max_workers)
+    except:
+        for dataset in datasets:
+            if dataset is not None:
+                dataset.close()
+        raise
+    return datasets
+
+
+def _check_members(datasets, urls, aggdim):
+    """
+    Check that the members can be aggregated and return the
+    aggregation dimension.
+    """
+    first = datasets[0]
+    if aggdim is None:
+        unlimited = [name for name in first.dimensions
+                     if first.dimensions[name].isunlimited()]
+        if not unlimited:
+            raise ValueError('%s has no unlimited dimension; '
+                             'aggdim must be given' % urls[0])
+        aggdim = unlimited[0]
+
+    reference = [(name, len(first.dimensions[name]))
+                 for name in first.dimensions if name != aggdim]
+    for dataset, url in zip(datasets, urls):
+        if aggdim not in dataset.dimensions:
+            raise ValueError('%s has no dimension %s' % (url, aggdim))
+        dimensions = [(name, len(dataset.dimensions[name]))
+                      for name in dataset.dimensions if name != aggdim]
+        if dimensions != reference:
+            raise ValueError('Dimensions of %s, %s, do not match those of '
+                             '%s, %s' % (url, dimensions, urls[0], reference))
+    return aggdim
+
+
+def _expand(getitem_tuple, ndim):
+    """
+    Expand an index to one item per dimension.
+    """
+    if not isinstance(getitem_tuple, tuple):
+        getitem_tuple = (getitem_tuple,)
+    ellipsis = [item is Ellipsis for item in getitem_tuple]
+    missing = ndim - len(getitem_tuple)
+    if any(ellipsis):
+        position = ellipsis.index(True)
+        return (getitem_tuple[:position] + (slice(None),) * (missing + 1) +
+                getitem_tuple[position + 1:])
+    return getitem_tuple + (slice(None),) * missing
+
+
+def _indices(item, length):
+    """
+    Indices selected along the aggregation dimension. Integers keep
+    the dimension, as with Dataset variables.
+    """
+    if isinstance(item, slice):
+        return np.arange(*item.indices(length))
+    if isinstance(item, (int, long, np.integer)):
+        item = [item]
+    item = np.asarray(item)
+    if item.dtype == np.bool_:
+        if item.shape != (length,):
+            raise IndexError('boolean index of shape %s does not match '
+                             'dimension of length %d' % (item.shape, length))
+        return np.nonzero(item)[0]
+    item = item.astype(int)
+    item = np.where(item < 0, item + length, item)
+    if item.size and (item.min() < 0 or item.max() >= length):
+        raise IndexError('index out of bounds for dimension of '
+                         'length %d' % length)
+    return item
+
+
+def _local_index(local):
+    """
+    A slice when the indices of a member form a single strided run.
+    """
+    if len(local) and (np.diff(local) > 0).all():
+        runs = proxy._runs(local)
+        if len(runs) == 1:
+            return runs[0][1]
+    return local
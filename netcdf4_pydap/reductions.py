@@ -0,0 +1,199 @@
+"""
+Reductions of remote variables computed block by block.
+
+The variable is read in blocks split along its leading dimensions, and
+each block is reduced into an accumulator before the next one is read, so
+that memory is bounded by the blocks in flight and the accumulator.
+
+Values that are NaN or equal to the _FillValue or missing_value attributes
+of the variable are ignored. Where all values are ignored, results are
+masked. Blocks are masked and unpacked as the variable reads them: with
+set_auto_mask, the values it masks are ignored, and with set_auto_scale,
+values are unpacked before they are reduced.
+"""
+
+import numpy as np
+
+__all__ = ['reduce', 'histogram']
+
+BLOCK_SIZE = 64 * 2**20
+
+OPERATIONS = ('sum', 'mean', 'min', 'max', 'count')
+
+
+def reduce(variable, operation, axis=None, block_size=BLOCK_SIZE,
+           max_workers=1):
+    """
+    Reduce a core.Variable along `axis`.
+
+    Parameters
+    ----------
+
+    variable : core.Variable
+    operation : str
+        One of sum, mean, min, max or count.
+    axis : int or tuple of int, optional
+        Axes reduced.
+        Default: None, all axes.
+    block_size : int, optional
+        Size in bytes of the blocks read.
+        Default: 64 MB.
+    max_workers : int, optional
+        Number of blocks read concurrently.
+        Default: 1.
+    """
+    if operation not in OPERATIONS:
+        raise ValueError('Unknown reduction %s, expected one of %s' %
+                         (operation, ', '.join(OPERATIONS)))
+    axes = _axes(axis, variable.ndim)
+    out_shape = tuple(length for position, length in enumerate(variable.shape)
+                      if position not in axes)
+    dtype = _dtype(variable)
+
+    count = np.zeros(out_shape, dtype=np.int64)
+    if operation in ('sum', 'mean'):
+        result = np.zeros(out_shape, dtype=_sum_dtype(dtype))
+    elif operation in ('min', 'max'):
+        result = np.zeros(out_shape, dtype=dtype)
+    else:
+        result = count
+
+    for tile, block, valid in _blocks(variable, block_size, max_workers):
+        dest = tuple(item for position, item in enumerate(tile)
+                     if position not in axes)
+        block_count = valid.sum(axis=axes)
+        if operation in ('sum', 'mean'):
+            result[dest] += np.where(valid, block, 0).sum(axis=axes,
+                                                          dtype=result.dtype)
+        elif operation in ('min', 'max'):
+            masked = np.ma.masked_array(block, ~valid)
+            if operation == 'min':
+                partial = masked.min(axis=axes)
+                combine = np.minimum
+            else:
+                partial = masked.max(axis=axes)
+                combine = np.maximum
+            partial = np.ma.filled(partial, 0)
+            result[dest] = np.where(count[dest] == 0, partial,
+                                    np.where(block_count == 0, result[dest],
+                                             combine(result[dest], partial)))
+        count[dest] += block_count
+
+    if operation == 'mean':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Integer sums are not floor divided:
+            result = np.true_divide(result, count)
+    if operation != 'count' and (count == 0).any():
+        result = np.ma.masked_array(result, count == 0)
+    return result[()]
+
+
+def histogram(variable, bins=10, range=None, block_size=BLOCK_SIZE,
+              max_workers=1):
+    """
+    Histogram of the values of a core.Variable, as numpy.histogram.
+
+    Without `range`, the variable is read twice: once for its minimum and
+    maximum, once for the histogram.
+    """
+    if range is None and np.ndim(bins) == 0:
+        range = _range(variable, block_size, max_workers)
+    dummy, edges = np.histogram([], bins=bins, range=range)
+    counts = np.zeros(len(edges) - 1, dtype=np.int64)
+    for tile, block, valid in _blocks(variable, block_size, max_workers):
+        values = block[valid]
+        counts += np.histogram(values, bins=edges)[0]
+    return counts, edges
+
+
+def _range(variable, block_size, max_workers):
+    """
+    Minimum and maximum of the valid values, read in a single pass.
+    """
+    low = high = None
+    for tile, block, valid in _blocks(variable, block_size, max_workers):
+        values = block[valid]
+        if values.size:
+            if low is None:
+                low, high = values.min(), values.max()
+            else:
+                low = min(low, values.min())
+                high = max(high, values.max())
+    if low is None:
+        # All values are missing:
+        return 0, 1
+    return low, high
+
+
+def _blocks(variable, block_size, max_workers):
+    """
+    Iterate over (tile, block, valid) triples, where block is masked and
+    unpacked as the variable reads it and valid is a boolean array.
+    """
+    packing = variable._active_packing()
+    fill_values = _fill_values(variable)
+    array_proxy = variable._array_proxy()
+    for tile, block in array_proxy.iter_blocks(block_size, max_workers):
+        if packing is not None:
+            block = packing.packed(block)
+        if packing is not None and variable.mask:
+            invalid = packing.invalid(block)
+            if invalid is None:
+                valid = np.ones(block.shape, dtype=bool)
+            else:
+                valid = np.logical_not(invalid, out=invalid)
+        else:
+            valid = _valid(block, fill_values)
+        if packing is not None and variable.scale:
+            block = packing.scale(block)
+        yield tile, block, valid
+
+
+def _dtype(variable):
+    # Type of the blocks yielded by _blocks:
+    packing = variable._active_packing()
+    if packing is None:
+        return variable.dtype
+    if variable.scale:
+        return packing.unpacked_dtype
+    return packing.dtype
+
+
+def _axes(axis, ndim):
+    if axis is None:
+        return tuple(range(ndim))
+    if not isinstance(axis, tuple):
+        axis = (axis,)
+    axes = []
+    for item in axis:
+        if not -ndim <= item < ndim:
+            raise ValueError('axis %d is out of bounds for a variable with '
+                             '%d dimensions' % (item, ndim))
+        axes.append(item % ndim)
+    return tuple(sorted(set(axes)))
+
+
+def _fill_values(variable):
+    fill_values = []
+    for name in ('_FillValue', 'missing_value'):
+        if name in variable.ncattrs():
+            fill_values.extend(np.ravel(variable.getncattr(name)))
+    return fill_values
+
+
+def _valid(block, fill_values):
+    valid = np.ones(block.shape, dtype=bool)
+    if block.dtype.kind in 'fc':
+        valid &= ~np.isnan(block)
+    for value in fill_values:
+        # Attributes are compared at the precision of the data:
+        valid &= block != np.asarray(value).astype(block.dtype)
+    return valid
+
+
+def _sum_dtype(dtype):
+    if dtype.kind in 'fc':
+        return np.result_type(dtype, np.float64)
+    if dtype.kind == 'u':
+        return np.uint64
+    return np.int64
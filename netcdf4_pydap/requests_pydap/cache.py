@@ -0,0 +1,270 @@
+"""
+Caches for OPeNDAP datasets.
+
+BlockCache is an in-memory cache of decoded hyperslabs. Blocks are keyed
+by dataset url, variable id and hyperslab. A request that selects a subset
+of a cached block is served by slicing the block. The least recently used
+blocks are evicted once the cache exceeds its size.
+
+MetadataCache is an on-disk cache of dataset structures and attributes,
+keyed by url, so that datasets can be opened without requesting and
+parsing their DDS and DAS.
+"""
+
+import os
+import time
+import datetime
+import hashlib
+import tempfile
+import threading
+import cPickle as pickle
+from collections import OrderedDict
+
+import pydap.model
+from pydap.model import BaseType
+
+__all__ = ['BlockCache', 'MetadataCache']
+
+
+class BlockCache(object):
+    """
+    A least recently used cache of decoded arrays.
+
+    Parameters
+    ----------
+
+    max_size : int, optional
+        Size of the cache in bytes.
+        Default: 256 MB.
+    """
+    def __init__(self, max_size=256 * 2**20):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._blocks = OrderedDict()
+        self._keys = dict()
+        self._lock = threading.Lock()
+
+    def get(self, url, id, slice_, shape):
+        """
+        Return a copy of the data for fixed slice `slice_` of a variable
+        with shape `shape`, or None if it is not in the cache.
+        """
+        hyperslab = _normalize(slice_, shape)
+        with self._lock:
+            for key in self._keys.get((url, id), []):
+                local_slice = _subslice(hyperslab, key[2])
+                if local_slice is not None:
+                    data = self._blocks.pop(key)
+                    self._blocks[key] = data
+                    self.hits += 1
+                    return data[local_slice].copy()
+            self.misses += 1
+        return None
+
+    def put(self, url, id, slice_, shape, data):
+        """
+        Store a copy of `data`, the values of fixed slice `slice_`.
+        """
+        if data.nbytes > self.max_size:
+            return
+        key = (url, id, _normalize(slice_, shape))
+        with self._lock:
+            if key in self._blocks:
+                return
+            self._blocks[key] = data.copy()
+            self._keys.setdefault((url, id), []).append(key)
+            self.size += data.nbytes
+            while self.size > self.max_size:
+                old_key, old_data = self._blocks.popitem(last=False)
+                self._keys[old_key[:2]].remove(old_key)
+                if not self._keys[old_key[:2]]:
+                    del self._keys[old_key[:2]]
+                self.size -= old_data.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+            self._keys.clear()
+            self.size = 0
+
+    def __repr__(self):
+        return ('<%s: %d blocks, %d bytes, %d hits, %d misses>' %
+                (self.__class__.__name__, len(self._blocks), self.size,
+                 self.hits, self.misses))
+
+
+def _normalize(slice_, shape):
+    """
+    Convert a fixed slice to a tuple of (start, count, step).
+    """
+    return tuple((s.start, len(xrange(s.start, min(s.stop, length), s.step)),
+                  s.step)
+                 for s, length in zip(slice_, shape))
+
+
+def _subslice(hyperslab, block):
+    """
+    Slice of `block` that selects `hyperslab`, or None if `hyperslab`
+    is not a subset of `block`.
+    """
+    out = []
+    for (start, count, step), (b_start, b_count, b_step) in zip(hyperslab,
+                                                                 block):
+        if count == 0:
+            out.append(slice(0, 0))
+            continue
+        offset = start - b_start
+        if offset < 0 or offset % b_step != 0:
+            return None
+        if count > 1 and step % b_step != 0:
+            return None
+        local_start = offset // b_step
+        local_step = step // b_step if count > 1 else 1
+        local_stop = local_start + (count - 1) * local_step + 1
+        if local_stop > b_count:
+            return None
+        out.append(slice(local_start, local_stop, local_step))
+    return tuple(out)
+
+
+class MetadataCache(object):
+    """
+    An on-disk cache of dataset structures and attributes.
+
+    Entries younger than `expire_after` are used without contacting the
+    server. Older entries are revalidated with a conditional request on
+    the DDS when the server sent an ETag or a Last-Modified header.
+    Entries are written atomically and can be shared between processes.
+
+    Parameters
+    ----------
+
+    directory : str
+        Directory where entries are stored. Created if it does not exist.
+    expire_after : datetime.timedelta, optional
+        How long entries are used without revalidation.
+        Default: 1 day.
+    """
+    def __init__(self, directory, expire_after=datetime.timedelta(days=1)):
+        self.directory = directory
+        self.expire_after = expire_after
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # Created by another process:
+                if not os.path.isdir(self.directory):
+                    raise
+
+    def _path(self, url):
+        return os.path.join(self.directory,
+                            hashlib.sha1(url).hexdigest() + '.pickle')
+
+    def load(self, url):
+        """
+        Return the entry for `url` or None.
+        """
+        try:
+            with open(self._path(url), 'rb') as entry_file:
+                entry = pickle.load(entry_file)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        if entry.get('url') != url:
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        age = time.time() - entry['time']
+        return age < _total_seconds(self.expire_after)
+
+    def validation_headers(self, entry):
+        """
+        Headers of a conditional request revalidating `entry`.
+        """
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def dataset(self, entry):
+        """
+        Build the dataset of `entry`.
+        """
+        dataset = _load(entry['tree'])
+        dataset._set_id()
+        return dataset
+
+    def save(self, url, dataset, headers):
+        """
+        Store `dataset`. `headers` are the headers of the DDS response.
+        """
+        self._write({'url': url,
+                     'time': time.time(),
+                     'etag': headers.get('etag'),
+                     'last_modified': headers.get('last-modified'),
+                     'tree': _dump(dataset)})
+
+    def touch(self, entry):
+        """
+        Mark `entry` as revalidated.
+        """
+        entry['time'] = time.time()
+        self._write(entry)
+
+    def _write(self, entry):
+        handle, temp_path = tempfile.mkstemp(dir=self.directory,
+                                             suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as entry_file:
+                pickle.dump(entry, entry_file, pickle.HIGHEST_PROTOCOL)
+            os.rename(temp_path, self._path(entry['url']))
+        except:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+def _total_seconds(delta):
+    if isinstance(delta, datetime.timedelta):
+        return delta.total_seconds()
+    return delta
+
+
+def _dump(var):
+    """
+    Convert a pydap variable, without data, to builtin types.
+    """
+    out = (var.__class__.__name__, var._name, var.attributes)
+    if isinstance(var, BaseType):
+        return out + (var.type.descriptor, var.shape, var.dimensions)
+    return out + ([_dump(child) for child in var.walk()],)
+
+
+def _load(tree):
+    """
+    Rebuild a variable converted with _dump.
+    """
+    kind, name, attributes = tree[:3]
+    # Names are stored quoted and are set after the construction:
+    if kind == 'BaseType':
+        var = BaseType('', type=getattr(pydap.model, tree[3]), shape=tree[4],
+                       dimensions=tree[5], attributes=attributes)
+    else:
+        var = getattr(pydap.model, kind)('', attributes=attributes)
+    var._name = name
+    if kind == 'SequenceType':
+        for child_tree in tree[3]:
+            child = _load(child_tree)
+            var[child._name] = child
+    elif kind != 'BaseType':
+        # Fill the pydap odict directly since its __setitem__ is
+        # linear in the number of children:
+        for child_tree in tree[3]:
+            child = _load(child_tree)
+            var._keys.append(child._name)
+            var._dict[child._name] = child
+    return var
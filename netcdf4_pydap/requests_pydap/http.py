@@ -25,11 +25,15 @@ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLI
 """
 
 import re
+import sys
+import threading
+import time
 from urlparse import urlsplit, urlunsplit
 
 import requests
 import requests_cache
 import warnings
+import six
 
 import pydap.lib
 import pydap.client
@@ -50,7 +54,10 @@ import netCDF4.utils as utils
 
 #Internal:
 from . import proxy
+from . import xdr
 from .. import sessions
+from .. import retries
+from ..stats import Stats, process_stats, request_kind, count_wire_bytes
 from ..cas import get_cookies
 
 python3=False
@@ -67,34 +74,57 @@ class Pydap_Dataset:
     def __init__(self,url,cache=None,expire_after=datetime.timedelta(hours=1),timeout=120,
                  session=None,username=None,password=None,
                  authentication_url=None, use_certificates=False,
-                 authenticate=False):
+                 authenticate=False, keep_alive=False, pool_maxsize=10,
+                 max_workers=1, max_tile_size=64 * 2**20, block_cache=None,
+                 metadata_cache=None, cookie_store=None, retry=None,
+                 stats=None, compression=True):
 
         self._url = url
         self.timeout = timeout
         self.use_certificates = use_certificates
         self.passed_session = session
+        self.keep_alive = keep_alive
+        self.max_workers = max_workers
+        self.max_tile_size = max_tile_size
+        self.block_cache = block_cache
+        self.metadata_cache = metadata_cache
+        self.retry = retry
+        self.compression = compression
+        if stats is None:
+            stats = Stats(parent=process_stats)
+        self.stats = stats
 
         self.username = username
         self.password = password
         self.authentication_url = authentication_url
+        self.cookie_store = cookie_store
+        self._cookie_time = None
+        # Incremented by each login made after a failed data request:
+        self._auth_generation = 0
+        self._auth_lock = threading.Lock()
 
         if (isinstance(self.passed_session,requests.Session) or
             isinstance(self.passed_session,requests_cache.core.CachedSession)
             ):
             self.session = self.passed_session
         else:
-            self.session = sessions.create_single_session(cache=cache,expire_after=expire_after)
-
-        if (not self.use_certificates and authenticate):
-            self.session = get_cookies.setup_session(self.authentication_url,
-                                                     username=self.username,
-                                                     password=self.password,
-                                                     session=self.session,
-                                                     verify=False,
-                                                     check_url=self._url)
+            if self.keep_alive:
+                self.session = sessions.create_single_session(cache=cache,expire_after=expire_after,
+                                                              pool_maxsize=pool_maxsize)
+            else:
+                self.session = sessions.create_single_session(cache=cache,expire_after=expire_after)
+
+        if (not self.use_certificates and authenticate and
+            cookie_store is None):
+            self._login()
         #Assign dataset:
         try:
-            self._assign_dataset()
+            if (not self.use_certificates and
+                self.authentication_url is not None and
+                cookie_store is not None):
+                self._assign_dataset_with_cookies(cookie_store)
+            else:
+                self._assign_dataset()
         except (requests.exceptions.SSLError,
                requests.exceptions.ConnectTimeout) as e:
                 raise requests.exceptions.HTTPError('401 ' + str(e))
@@ -108,9 +138,15 @@ class Pydap_Dataset:
         # Set data to a Proxy object for BaseType and SequenceType. These
         # variables can then be sliced to retrieve the data on-the-fly.
         for var in walk(self._dataset, BaseType):
-            var.data = proxy.ArrayProxy(var.id, url, var.shape, self._request)
+            var.data = proxy.ArrayProxy(var.id, url, var.shape, self._data_request,
+                                        dtype=_dtype(var),
+                                        max_workers=self.max_workers,
+                                        max_tile_size=self.max_tile_size,
+                                        block_cache=self.block_cache,
+                                        retry=self.retry,
+                                        stats=self.stats)
         for var in walk(self._dataset, SequenceType):
-            var.data = proxy.SequenceProxy(var.id, url, self._request)
+            var.data = proxy.SequenceProxy(var.id, url, self._data_request)
 
         # Set server-side functions.
         self._dataset.functions = pydap.client.Functions(url)
@@ -134,26 +170,120 @@ class Pydap_Dataset:
         else:
             raise ServerError("Unable to open dataset.")
 
-    def _request(self,mod_url):
+    def _assign_dataset_with_cookies(self, cookie_store):
+        # Stored cookies, possibly from another process, are tried first.
+        # The store logs in only if they are missing or rejected:
+        self._cookie_time = cookie_store.load(self.session,
+                                              self.authentication_url,
+                                              username=self.username,
+                                              check_url=self._url)
+        try:
+            self._assign_dataset()
+        except requests.exceptions.HTTPError as e:
+            if not str(e).startswith('40'):
+                raise
+            self._login()
+            self._assign_dataset()
+
+    def _login(self):
+        if (self.cookie_store is not None and
+            self.authentication_url is not None):
+            self.session = self.cookie_store.login(self.session,
+                                                   self.authentication_url,
+                                                   username=self.username,
+                                                   password=self.password,
+                                                   verify=False,
+                                                   check_url=self._url,
+                                                   rejected=self._cookie_time)
+            self._cookie_time = self.cookie_store.load(self.session,
+                                                       self.authentication_url,
+                                                       username=self.username,
+                                                       check_url=self._url)
+        else:
+            self.session = get_cookies.setup_session(self.authentication_url,
+                                                     username=self.username,
+                                                     password=self.password,
+                                                     session=self.session,
+                                                     verify=False,
+                                                     check_url=self._url)
+
+    def reauthenticate(self, generation=None):
+        """
+        Refresh the credentials of the session.
+
+        `generation` is the value of _auth_generation when the failed
+        request was sent. Threads whose requests failed with the same
+        credentials share a single login.
+        """
+        with self._auth_lock:
+            if generation is not None and generation != self._auth_generation:
+                # Another thread logged in since the request was sent:
+                return
+            self._login()
+            self._auth_generation += 1
+
+    def _data_request(self,mod_url,stream=False,headers=None):
+        """
+        _request for the proxies. On a 40x error, the credentials of the
+        session are refreshed and the request is sent once more, without
+        requesting the DDS and DAS again.
+        """
+        generation = self._auth_generation
+        try:
+            return self._request(mod_url,stream=stream,headers=headers)
+        except requests.exceptions.HTTPError as e:
+            if (self.use_certificates or
+                not str(e).startswith('40')):
+                raise
+        self.reauthenticate(generation)
+        return self._request(mod_url,stream=stream,headers=headers)
+
+    def _request(self,mod_url,stream=False,headers=None):
         """
         Open a given URL and return headers and body.
         This function retrieves data from a given URL, returning the headers
         and the response body. Authentication can be set by adding the
         username and password to the URL; this will be sent as clear text
         only if the server only supports Basic authentication.
+
+        With stream=True the body is not downloaded and None is returned
+        in its place. It must be read from the response, which the caller
+        must close.
+
+        headers are added to the request headers. A 304 Not Modified
+        response to a conditional request is returned without error.
+
+        Without stream, failed requests are retried according to the
+        retry policy. Streamed requests are retried by the caller, which
+        reads the body.
         """
+        if stream:
+            return self._request_once(mod_url,stream=stream,headers=headers)
+        return retries.call(self.retry, mod_url,
+                            lambda: self._request_once(mod_url,headers=headers))
+
+    def _request_once(self,mod_url,stream=False,headers=None):
+        extra_headers = headers
         scheme, netloc, path, query, fragment = urlsplit(mod_url)
         mod_url = urlunsplit((
                 scheme, netloc, path, query, fragment
                 )).rstrip('?&')
 
-        headers = {
-            'user-agent': pydap.lib.USER_AGENT,
-            'connection': 'close'}
-            # Cannot keep-alive because the current pydap structure
-            # leads to file descriptor leaks. Would require a careful closing
-            # of requests resposes.
-            #'connection': 'keep-alive'}
+        headers = {'user-agent': pydap.lib.USER_AGENT}
+        if self.keep_alive:
+            # Connections are returned to the session's pool. This relies on
+            # every caller closing the response it receives, which ArrayProxy,
+            # SequenceProxy and _ddsdas do in a finally clause.
+            headers['connection'] = 'keep-alive'
+        else:
+            headers['connection'] = 'close'
+        # Responses are decompressed by requests while they are read:
+        if self.compression:
+            headers['accept-encoding'] = 'gzip, deflate'
+        else:
+            headers['accept-encoding'] = 'identity'
+        if extra_headers:
+            headers.update(extra_headers)
 
         if self.use_certificates:
             try:
@@ -167,22 +297,65 @@ class Pydap_Dataset:
                  warnings.filterwarnings('ignore', message=('Unverified HTTPS request is being made.' 
                                                             ' Adding certificate verification is strongly advised.'
                                                             ' See: https://urllib3.readthedocs.org/en/latest/security.html'))
-                 resp = self.session.get(mod_url, 
+                 resp = self._get(mod_url,
                                          cert=(X509_PROXY,X509_PROXY),
                                          verify=False,
                                          headers=headers,
                                          allow_redirects=True,
-                                         timeout=self.timeout)
-            _check_errors(resp)
+                                         timeout=self.timeout,
+                                         stream=stream)
+            if resp.status_code != 304:
+                _check_errors(resp)
         else:
             #cookies are assumed to be passed to the session:
-            resp = self.session.get(mod_url, 
+            resp = self._get(mod_url,
                                     headers=headers,
                                     allow_redirects=True,
-                                    timeout=self.timeout)
-            _check_errors(resp)
+                                    timeout=self.timeout,
+                                    stream=stream)
+            if resp.status_code != 304:
+                _check_errors(resp)
+        if stream:
+            return resp.headers, None, resp
         return resp.headers, resp.content, resp
 
+    def _get(self,mod_url,**kwargs):
+        """
+        session.get, recording the request in the stats.
+        """
+        tags = {'url': mod_url}
+        kind = request_kind(mod_url)
+        self.stats.count('requests.' + kind, tags=tags)
+        start = time.time()
+        try:
+            resp = self.session.get(mod_url, **kwargs)
+            if not kwargs.get('stream'):
+                size = len(resp.content)
+        except Exception:
+            self.stats.count('errors.' + kind, tags=tags)
+            raise
+        if not resp.ok and resp.status_code != 304:
+            self.stats.count('errors.' + kind, tags=tags)
+
+        from_cache = getattr(resp, 'from_cache', None)
+        if from_cache is not None:
+            self.stats.count('cache_hits' if from_cache else 'cache_misses',
+                             tags=tags)
+        if not from_cache:
+            # elapsed stops when the headers are received:
+            time_to_first_byte = resp.elapsed.total_seconds()
+            self.stats.time('time_to_first_byte.' + kind, time_to_first_byte,
+                            tags)
+            if not kwargs.get('stream'):
+                self.stats.time('download.' + kind,
+                                max(0.0, time.time() - start - time_to_first_byte),
+                                tags)
+        if not kwargs.get('stream'):
+            self.stats.count('bytes.' + kind, size, tags)
+            if not from_cache:
+                count_wire_bytes(self.stats, resp, kind, tags)
+        return resp
+
 
     def _ddx(self):
         """
@@ -207,15 +380,64 @@ class Pydap_Dataset:
         dasurl = urlunsplit(
                 (scheme, netloc, path + '.das', query, fragment))
 
-        headerdds, dds, respdds = self._request(ddsurl)
-        headerdas, das, respdas = self._request(dasurl)
+        if self.metadata_cache is None:
+            return self._fetch_ddsdas(ddsurl, dasurl)[0]
+
+        entry = self.metadata_cache.load(self._url)
+        if entry is not None:
+            if self.metadata_cache.is_fresh(entry):
+                return self.metadata_cache.dataset(entry)
+            validation_headers = self.metadata_cache.validation_headers(entry)
+            if validation_headers:
+                headerdds, dds, respdds = self._request(ddsurl,
+                                                        headers=validation_headers)
+                respdds.close()
+                if respdds.status_code == 304:
+                    self.metadata_cache.touch(entry)
+                    return self.metadata_cache.dataset(entry)
+                # The dataset changed, only the DAS is left to request:
+                dataset, headerdds = self._fetch_ddsdas(ddsurl, dasurl,
+                                                        (headerdds, dds))
+                self.metadata_cache.save(self._url, dataset, headerdds)
+                return dataset
+
+        dataset, headerdds = self._fetch_ddsdas(ddsurl, dasurl)
+        self.metadata_cache.save(self._url, dataset, headerdds)
+        return dataset
+
+    def _fetch_ddsdas(self, ddsurl, dasurl, dds_response=None):
+        """
+        Parse the DDS and DAS. Returns the dataset and the DDS headers.
 
-        # Build the dataset structure and attributes.
-        dataset = DDSParser(dds).parse()
-        respdds.close()
-        dataset = DASParser(das, dataset).parse()
+        `dds_response` is a (headers, body) pair of a DDS already received.
+        """
+        # Both responses are requested concurrently and the DDS
+        # is parsed while the DAS is still downloading:
+        das_request = _BackgroundRequest(self._request, dasurl)
+        das_request.start()
+        try:
+            if dds_response is None:
+                headerdds, dds, respdds = self._request(ddsurl)
+                respdds.close()
+            else:
+                headerdds, dds = dds_response
+            # Build the dataset structure:
+            with self.stats.timer('parse.dds', {'url': ddsurl}):
+                dataset = DDSParser(dds).parse()
+        except Exception:
+            # The DDS error has precedence, as when requests were sequential.
+            exc_info = sys.exc_info()
+            das_request.join()
+            if das_request.result is not None:
+                das_request.result[2].close()
+            six.reraise(*exc_info)
+
+        # Add attributes:
+        headerdas, das, respdas = das_request.get()
         respdas.close()
-        return dataset
+        with self.stats.timer('parse.das', {'url': dasurl}):
+            dataset = DASParser(das, dataset).parse()
+        return dataset, headerdds
 
     def close(self):
         if not (isinstance(self.passed_session,requests.Session) or
@@ -230,9 +452,44 @@ class Pydap_Dataset:
     def __exit__(self,atype,value,traceback):
         self.close()
 
+def _dtype(var):
+    """
+    The numpy dtype of a BaseType on the wire. None for strings.
+    """
+    if var.type.size is None:
+        return None
+    return xdr.wire_dtype(var.type)
+
+class _BackgroundRequest(threading.Thread):
+    """
+    Run a request function in a thread. Exceptions are raised
+    in the calling thread by get().
+    """
+    def __init__(self, request, url):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.request = request
+        self.url = url
+        self.result = None
+        self.exc_info = None
+
+    def run(self):
+        try:
+            self.result = self.request(self.url)
+        except Exception:
+            self.exc_info = sys.exc_info()
+
+    def get(self):
+        self.join()
+        if self.exc_info is not None:
+            six.reraise(*self.exc_info)
+        return self.result
+
 def _check_errors(resp):
         # When an error is returned, we parse the error message from the
         # server and return it in a ``ClientError`` exception.
+        # The response is closed whenever an exception is raised since
+        # the caller never gets a handle on it.
         try:
             if resp.headers["content-description"] in ["dods_error", "dods-error"]:
                 m = re.search('code = (?P<code>[^;]+);\s*message = "(?P<msg>.*)"',
@@ -241,7 +498,12 @@ def _check_errors(resp):
                 msg = 'Server error %(code)s: "%(msg)s"' % m.groupdict()
                 raise ServerError(msg)
         except KeyError as e:
+            resp.close()
             raise ServerError('Server is not OPENDAP')
         finally:
-            resp.raise_for_status()
+            try:
+                resp.raise_for_status()
+            except requests.exceptions.HTTPError:
+                resp.close()
+                raise
 
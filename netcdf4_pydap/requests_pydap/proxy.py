@@ -28,8 +28,12 @@ import sys
 import re
 from urlparse import urlsplit, urlunsplit
 import copy
+import contextlib
+import itertools
 import warnings 
 
+import numpy as np
+
 from pydap.model import *
 from pydap.model import SequenceData
 from pydap.lib import hyperslab, combine_slices, fix_slice, walk, isiterable, encode_atom
@@ -37,7 +41,12 @@ from pydap.parsers.dds import DDSParser
 from pydap.xdr import DapUnpacker
 from pydap.proxy import VariableProxy
 
-__all__ = ['ArrayProxy', 'SequenceProxy']
+from . import xdr
+from .. import retries
+from .._pool import thread_map
+from ..stats import counted, count_wire_bytes
+
+__all__ = ['ArrayProxy', 'SequenceProxy', 'fetch_many']
 
 
 class ConstraintExpression(object):
@@ -75,12 +84,35 @@ class ArrayProxy(VariableProxy):
     """
     Proxy to an Opendap basetype.
 
+    When `max_workers` is larger than one and `dtype` is known, requests
+    larger than `max_tile_size` bytes are split along the leading dimensions
+    into tiles that are fetched concurrently and assembled in a single array.
+
+    When a `block_cache` is given, requests are first looked up in it.
+
+    Requests that fail, including while the response is read, are
+    retried according to the `retry` policy.
+
+    Bytes received and decoding times are recorded in `stats`.
+
+    Integer sequences and boolean masks are indexed orthogonally, as in
+    netCDF4-python. The indices requested along each axis are grouped into
+    strided runs and only the hyperslabs covering those runs are requested.
+
     """
-    def __init__(self, id, url, shape, request_function_handle, slice_=None):
+    def __init__(self, id, url, shape, request_function_handle, slice_=None,
+                 dtype=None, max_workers=1, max_tile_size=64 * 2**20,
+                 block_cache=None, retry=None, stats=None):
         self.id = id
         self.url = url
         self._shape = shape
         self.request=request_function_handle
+        self.dtype = dtype
+        self.max_workers = max_workers
+        self.max_tile_size = max_tile_size
+        self.block_cache = block_cache
+        self.retry = retry
+        self.stats = stats
 
         if slice_ is None:
             self._slice = (slice(None),) * len(shape)
@@ -105,39 +137,165 @@ class ArrayProxy(VariableProxy):
         return iter(self[:])
 
     def __getitem__(self, index):
+        if _is_orthogonal(index):
+            return self._getitem_orthogonal(index)
         slice_ = combine_slices(self._slice, fix_slice(index, self.shape))
+        return self._get(slice_)
+
+    def _get(self, slice_, out=None):
+        if self.block_cache is not None:
+            data = self.block_cache.get(self.url, self.id, slice_, self.shape)
+            if data is not None:
+                if out is not None:
+                    out[...] = data
+                    return out
+                return data
+
+        data = self._read(slice_, out=out)
+        if self.block_cache is not None and isinstance(data, np.ndarray):
+            self.block_cache.put(self.url, self.id, slice_, self.shape, data)
+        return data
+
+    def _read(self, slice_, out=None):
+        if self.max_workers > 1 and self.dtype is not None:
+            tiles = _tiles(slice_, self.shape, self.dtype.itemsize,
+                           self.max_tile_size)
+            if len(tiles) > 1:
+                return self._fetch_tiles(slice_, tiles, out=out)
+        return self._fetch(slice_, out=out)
+
+    def _fetch_tiles(self, slice_, tiles, out=None):
+        if out is None:
+            out = np.empty(_shape(slice_, self.shape), dtype=self.dtype)
+
+        def fetch(tile):
+            # Tiles are decoded directly into the output:
+            self._fetch(_tile_slice(slice_, tile), out=out[tile])
+
+        thread_map(fetch, tiles, self.max_workers)
+        return out
+
+    def _getitem_orthogonal(self, index):
+        """
+        Read an orthogonal index with one request per combination of the
+        runs of indices along each axis. Runs are read into an array of
+        the sorted unique indices, which is then put in the order requested.
+        """
+        axes = _orthogonal_axes(index, self.shape)
+        shape = tuple(count for count, runs, inverse in axes)
+        pieces = [(tuple(dest for dest, src in piece),
+                   combine_slices(self._slice, tuple(src for dest, src in piece)))
+                  for piece in itertools.product(*[runs for count, runs, inverse
+                                                   in axes])]
+
+        if self.dtype is not None or not pieces:
+            out = np.empty(shape, dtype=self.dtype)
+
+            def fetch(piece):
+                dest, slice_ = piece
+                self._get(slice_, out=out[dest])
+
+            thread_map(fetch, pieces, self.max_workers)
+        else:
+            # Strings: the width is only known once the data is read.
+            values = [self._get(slice_) for dest, slice_ in pieces]
+            out = np.empty(shape, dtype=np.result_type(*values))
+            for (dest, slice_), value in zip(pieces, values):
+                out[dest] = value
+
+        for axis, (count, runs, inverse) in enumerate(axes):
+            if inverse is not None:
+                out = out.take(inverse, axis=axis)
+        return out
+
+    def _fetch(self, slice_, out=None):
+        """
+        Fetch a fixed slice in a single request. The response is decoded
+        while it is downloaded, into `out` if it is given.
+        """
         scheme, netloc, path, query, fragment = urlsplit(self.url)
         url = urlunsplit((
                 scheme, netloc, path + '.dods',
                 self.id + hyperslab(slice_) + '&' + query,
                 fragment))
 
-        resp, data, top_resp = self.request(url)
-        dds, xdrdata = data.split('\nData:\n', 1)
-        dataset = DDSParser(dds).parse()
-        data = data2 = DapUnpacker(xdrdata, dataset).getvalue()
-
-        # Retrieve the data from any parent structure(s).
-        for var in walk(dataset):
-            if type(var) in (StructureType, DatasetType):
-                data = data[0]
-            elif var.id == self.id: 
+        def fetch():
+            resp, data, top_resp = self.request(url, stream=True)
+            try:
+                with _timer(self.stats, 'decode', url):
+                    reader = xdr.StreamReader(_counted(top_resp, self.stats, url))
+                    dataset = DDSParser(reader.read_header()).parse()
+                    targets = {}
+                    if out is not None:
+                        targets[_target_id(dataset, self.id)] = out
+                    data = xdr.unpack_stream(reader, dataset, targets)
+                count_wire_bytes(self.stats, top_resp, 'dods', {'url': url})
+                return dataset, data
+            finally:
                 top_resp.close()
-                return data
 
-        # Some old servers return the wrong response. :-/
-        # I found a server that would return an array to a request
-        # for an array inside a grid (instead of a structure with
-        # the array); this will take care of it.
-        for var in walk(dataset):
-            if type(var) in (StructureType, DatasetType):
-                data2 = data2[0]
-            elif self.id.endswith(var.id):
-                top_resp.close()
-                return data2
-            
+        dataset, data = retries.call(self.retry, url, fetch)
+
+        data = _select(dataset, data, self.id)
+        if out is not None and data is not out:
+            out[...] = data
+            return out
+        return data
+
+    def read_into(self, out, index=Ellipsis):
+        """
+        Read `index` into `out`, tile by tile, and return `out`.
+
+        `out` is a writable array, e.g. a numpy.memmap, with as many values
+        as the index selects, or a writable buffer of that many values of
+        `dtype`. Each tile of at most `max_tile_size` bytes is decoded from
+        the response directly into its part of `out`, and `max_workers`
+        tiles are read concurrently. Integer sequences and boolean masks
+        are not supported.
+        """
+        if self.dtype is None:
+            raise TypeError('%s cannot be read into a buffer' % self.id)
+        if _is_orthogonal(index):
+            raise IndexError('read_into only supports integers and slices')
+        slice_ = combine_slices(self._slice, fix_slice(index, self.shape))
+        dest = _destination(out, _shape(slice_, self.shape), self.dtype)
+        tiles = _tiles(slice_, self.shape, self.dtype.itemsize,
+                       self.max_tile_size)
+
+        def fetch(tile):
+            self._get(_tile_slice(slice_, tile), out=dest[tile])
+
+        thread_map(fetch, tiles, self.max_workers)
+        return out
+
+    def iter_blocks(self, block_size=64 * 2**20, max_workers=1):
+        """
+        Iterate over the data in blocks of at most `block_size` bytes, when
+        possible, split along the leading dimensions.
+
+        Yields (tile, data) pairs, where tile is a tuple of slices into the
+        whole array. With `max_workers` > 1, that many blocks are fetched
+        concurrently and held in memory at once.
+        """
+        if self.dtype is None:
+            raise TypeError('%s cannot be read by blocks' % self.id)
+        slice_ = fix_slice(self._slice, self.shape)
+        tiles = _tiles(slice_, self.shape, self.dtype.itemsize, block_size)
+        max_workers = max(1, max_workers)
+        for start in xrange(0, len(tiles), max_workers):
+            window = tiles[start:start + max_workers]
+            blocks = [None] * len(window)
+
+            def fetch(position):
+                blocks[position] = self._get(_tile_slice(slice_,
+                                                         window[position]))
+
+            thread_map(fetch, range(len(window)), max_workers)
+            for tile, block in zip(window, blocks):
+                yield tile, block
+
     # Comparisons return a boolean array
-    def __eq__(self, other): return self[:] == other 
+    def __eq__(self, other): return self[:] == other
     def __ne__(self, other): return self[:] != other
     def __ge__(self, other): return self[:] >= other
     def __le__(self, other): return self[:] <= other
@@ -145,6 +303,310 @@ class ArrayProxy(VariableProxy):
     def __lt__(self, other): return self[:] < other
 
 
+def fetch_many(requests):
+    """
+    Fetch slices of several variables of the same dataset in one request.
+
+    `requests` is a list of (ArrayProxy, index) pairs. The proxies must
+    point to the same dataset. Returns the list of the arrays requested.
+    """
+    slices = [combine_slices(array_proxy._slice,
+                             fix_slice(index, array_proxy.shape))
+              for array_proxy, index in requests]
+    out = [None] * len(requests)
+
+    # Serve what can be from the block caches:
+    missing = []
+    for position, (array_proxy, index) in enumerate(requests):
+        if array_proxy.block_cache is not None:
+            out[position] = array_proxy.block_cache.get(
+                array_proxy.url, array_proxy.id, slices[position],
+                array_proxy.shape)
+        if out[position] is None:
+            missing.append(position)
+    if not missing:
+        return out
+
+    first_proxy = requests[missing[0]][0]
+    scheme, netloc, path, query, fragment = urlsplit(first_proxy.url)
+    projection = ','.join(requests[position][0].id +
+                          hyperslab(slices[position])
+                          for position in missing)
+    url = urlunsplit((
+            scheme, netloc, path + '.dods',
+            projection + '&' + query,
+            fragment))
+
+    def fetch():
+        resp, data, top_resp = first_proxy.request(url, stream=True)
+        try:
+            with _timer(first_proxy.stats, 'decode', url):
+                reader = xdr.StreamReader(_counted(top_resp, first_proxy.stats,
+                                                   url))
+                dataset = DDSParser(reader.read_header()).parse()
+                data = xdr.unpack_stream(reader, dataset)
+            count_wire_bytes(first_proxy.stats, top_resp, 'dods', {'url': url})
+            return dataset, data
+        finally:
+            top_resp.close()
+
+    dataset, data = retries.call(first_proxy.retry, url, fetch)
+
+    values = _values_by_id(dataset, data)
+    for position in missing:
+        array_proxy = requests[position][0]
+        if array_proxy.id in values:
+            out[position] = values[array_proxy.id]
+        else:
+            # See _select for servers that do not return
+            # the structure of grids:
+            out[position] = values[_target_id(dataset, array_proxy.id)]
+        if (array_proxy.block_cache is not None and
+           isinstance(out[position], np.ndarray)):
+            array_proxy.block_cache.put(array_proxy.url, array_proxy.id,
+                                        slices[position], array_proxy.shape,
+                                        out[position])
+    return out
+
+
+def _counted(response, stats, url):
+    return counted(response.iter_content(xdr.CHUNK_SIZE), stats, 'bytes.dods',
+                   {'url': url})
+
+
+def _timer(stats, name, url):
+    if stats is None:
+        return _null_timer()
+    return stats.timer(name, {'url': url})
+
+
+@contextlib.contextmanager
+def _null_timer():
+    yield
+
+
+def _is_orthogonal(index):
+    if not isinstance(index, tuple):
+        index = (index,)
+    return any(_is_sequence(item) for item in index)
+
+
+def _is_sequence(item):
+    return isinstance(item, (list, np.ndarray)) and np.ndim(item) > 0
+
+
+def _orthogonal_axes(index, shape):
+    """
+    Describe an orthogonal index axis by axis.
+
+    Each axis is a (count, runs, inverse) tuple. `count` is the number of
+    unique indices read along the axis. `runs` is a list of (dest, src)
+    pairs of slices: `src` is a fixed slice of the variable and `dest` the
+    corresponding slice of the output. `inverse` takes the unique indices
+    to the order requested, or is None when they are in that order.
+    """
+    if not isinstance(index, tuple):
+        index = (index,)
+    missing = len(shape) - len(index)
+    ellipsis = [item is Ellipsis for item in index]
+    if any(ellipsis):
+        position = ellipsis.index(True)
+        index = (index[:position] + (slice(None),) * (missing + 1) +
+                 index[position + 1:])
+    else:
+        index = index + (slice(None),) * missing
+    if len(index) > len(shape):
+        raise IndexError('too many indices')
+
+    axes = []
+    for item, length in zip(index, shape):
+        if not _is_sequence(item):
+            slice_ = fix_slice(item, (length,))[0]
+            count = _shape((slice_,), (length,))[0]
+            axes.append((count, [(slice(0, count), slice_)], None))
+            continue
+
+        item = np.asarray(item)
+        if item.dtype == np.bool_:
+            if item.shape != (length,):
+                raise IndexError('boolean index of shape %s does not match '
+                                 'dimension of length %d' %
+                                 (item.shape, length))
+            item = item.nonzero()[0]
+        elif item.size == 0:
+            item = item.astype(int)
+        if item.ndim != 1 or not np.issubdtype(item.dtype, np.integer):
+            raise IndexError('only one-dimensional integer sequences and '
+                             'boolean masks are valid indices')
+        item = np.where(item < 0, item + length, item)
+        if item.size and (item.min() < 0 or item.max() >= length):
+            raise IndexError('index out of bounds for dimension of '
+                             'length %d' % length)
+
+        unique, inverse = np.unique(item, return_inverse=True)
+        if len(unique) == len(item) and (inverse == np.arange(len(item))).all():
+            inverse = None
+        axes.append((len(unique), _runs(unique), inverse))
+    return axes
+
+
+def _runs(indices):
+    """
+    Group sorted unique indices into strided runs.
+
+    Returns a list of (dest, src) pairs of slices, where `src` selects a run
+    of indices and `dest` is the position of the run in `indices`.
+    """
+    out = []
+    position = 0
+    while position < len(indices):
+        count = _run_length(indices, position)
+        if count == 2 and _run_length(indices, position + 1) > 2:
+            # The second index starts a longer run:
+            count = 1
+        start = int(indices[position])
+        step = int(indices[position + 1] - start) if count > 1 else 1
+        out.append((slice(position, position + count),
+                    slice(start, start + (count - 1) * step + 1, step)))
+        position += count
+    return out
+
+
+def _run_length(indices, position):
+    """
+    Number of indices in the strided run starting at `position`.
+    """
+    if position + 1 >= len(indices):
+        return len(indices) - position
+    step = indices[position + 1] - indices[position]
+    count = 2
+    while (position + count < len(indices) and
+           indices[position + count] - indices[position + count - 1] == step):
+        count += 1
+    return count
+
+
+def _values_by_id(var, data):
+    """
+    Map the ids of the BaseTypes in a response to their decoded data.
+    """
+    if isinstance(var, BaseType):
+        return {var.id: data}
+    out = {}
+    for child, child_data in zip(var.walk(), data):
+        out.update(_values_by_id(child, child_data))
+    return out
+
+
+def _select(dataset, data, id):
+    """
+    Retrieve the data of variable `id` from the decoded response.
+    """
+    data2 = data
+    # Retrieve the data from any parent structure(s).
+    for var in walk(dataset):
+        if type(var) in (StructureType, DatasetType):
+            data = data[0]
+        elif var.id == id: 
+            return data
+
+    # Some old servers return the wrong response. :-/
+    # I found a server that would return an array to a request
+    # for an array inside a grid (instead of a structure with
+    # the array); this will take care of it.
+    for var in walk(dataset):
+        if type(var) in (StructureType, DatasetType):
+            data2 = data2[0]
+        elif id.endswith(var.id):
+            return data2
+
+
+def _target_id(dataset, id):
+    """
+    The id, in the response, of the variable returned by _select.
+    """
+    for var in walk(dataset, BaseType):
+        if var.id == id:
+            return var.id
+    for var in walk(dataset, BaseType):
+        if id.endswith(var.id):
+            return var.id
+
+
+def _destination(out, shape, dtype):
+    """
+    A view of `out` with `shape`, that shares its memory.
+    """
+    if not isinstance(out, np.ndarray):
+        out = np.frombuffer(out, dtype=dtype)
+    if not out.flags.writeable:
+        raise ValueError('read_into requires a writable output')
+    if out.size != np.prod(shape):
+        raise ValueError('Output has %d values but %d were requested' %
+                         (out.size, np.prod(shape)))
+    view = out.view(np.ndarray)
+    try:
+        # Unlike reshape, never copies:
+        view.shape = shape
+    except AttributeError:
+        raise ValueError('Output cannot be viewed with shape %s' % (shape,))
+    return view
+
+
+def _shape(slice_, shape):
+    """
+    Shape of the array returned for a fixed slice.
+    """
+    return tuple(len(xrange(s.start, min(s.stop, length), s.step))
+                 for s, length in zip(slice_, shape))
+
+
+def _tiles(slice_, shape, itemsize, max_tile_size):
+    """
+    Split the output of a fixed slice along its leading dimensions into
+    tiles of at most `max_tile_size` bytes, when possible.
+
+    Tiles are tuples of slices into the output array.
+    """
+    out_shape = _shape(slice_, shape)
+    if (not out_shape or 0 in out_shape or
+        any(s.step < 0 for s in slice_)):
+        # Negative steps are read in a single request, as at the server:
+        return [tuple(slice(0, length) for length in out_shape)]
+
+    # Find the first axis along which contiguous blocks fit in a tile:
+    axis = len(out_shape) - 1
+    block_size = itemsize
+    for axis in range(len(out_shape) - 1, -1, -1):
+        if block_size * out_shape[axis] > max_tile_size:
+            break
+        block_size *= out_shape[axis]
+    else:
+        # Everything fits in one tile:
+        return [tuple(slice(0, length) for length in out_shape)]
+
+    step = max(1, max_tile_size // block_size)
+    ranges = [[slice(index, index + 1) for index in xrange(length)]
+              for length in out_shape[:axis]]
+    ranges.append([slice(start, min(start + step, out_shape[axis]))
+                   for start in xrange(0, out_shape[axis], step)])
+    ranges.extend([slice(0, length)] for length in out_shape[axis + 1:])
+    return list(itertools.product(*ranges))
+
+
+def _tile_slice(slice_, tile):
+    """
+    Convert a tile into the output of `slice_` to a request slice.
+    """
+    if any(s.step < 0 for s in slice_):
+        # The tile is the whole output, see _tiles:
+        return slice_
+    return tuple(slice(s.start + t.start * s.step,
+                       s.start + (t.stop - 1) * s.step + 1,
+                       s.step)
+                 for s, t in zip(slice_, tile))
+
+
 class SequenceProxy(VariableProxy, SequenceData):
     """
     Proxy to an Opendap Sequence.
@@ -203,7 +665,10 @@ class SequenceProxy(VariableProxy, SequenceData):
                 fragment))
 
         resp, data, top_resp = self.request(url)
-        dds, xdrdata = data.split('\nData:\n', 1)
+        try:
+            dds, xdrdata = data.split('\nData:\n', 1)
+        finally:
+            top_resp.close()
         dataset = DDSParser(dds).parse()
         dataset.data = DapUnpacker(xdrdata, dataset).getvalue()
         dataset._set_id()
@@ -217,7 +682,6 @@ class SequenceProxy(VariableProxy, SequenceData):
                 if isinstance(var, SequenceType):
                     order = [var.keys().index(k) for k in self.children]
                     data = reorder(order, data, var._nesting_level)
-                top_resp.close()
                 return iter(data)
 
     def __len__(self):
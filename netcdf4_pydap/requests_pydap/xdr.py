@@ -0,0 +1,157 @@
+"""
+Vectorized decoding of the XDR payload of DAP2 data responses.
+
+Responses are decoded while they are downloaded, from a StreamReader.
+Numeric BaseTypes, possibly nested in Structures and Grids, are read from
+the response chunks directly into their arrays, without the intermediate
+copies of the payload made by pydap.xdr.DapUnpacker. Arrays keep the
+big-endian dtype of the wire unless they are decoded into preallocated
+arrays of another type. Responses that contain Sequences, Strings or Urls
+are decoded with pydap.xdr.DapUnpacker.
+"""
+
+import numpy as np
+
+from pydap.model import BaseType, SequenceType, StructureType, Byte
+from pydap.lib import walk
+from pydap.xdr import DapUnpacker
+
+__all__ = ['unpack_stream', 'StreamReader']
+
+DATA_MARKER = '\nData:\n'
+CHUNK_SIZE = 2**20
+
+
+def wire_dtype(type_):
+    """
+    The numpy dtype of a numeric DAP type on the wire.
+    """
+    if type_ == Byte:
+        return np.dtype('B')
+    return np.dtype('>%s%s' % (type_.typecode, type_.size))
+
+
+def is_vectorizable(dataset):
+    for var in walk(dataset):
+        if (isinstance(var, SequenceType) or
+           (isinstance(var, BaseType) and var.type.size is None)):
+            return False
+    return True
+
+
+class StreamReader(object):
+    """
+    Read a .dods response from an iterable of byte chunks,
+    e.g. ``response.iter_content(CHUNK_SIZE)``.
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = ''
+        self._pos = 0
+
+    def _fill(self):
+        # Only called once the buffer is consumed:
+        for chunk in self._chunks:
+            if chunk:
+                self._buffer = chunk
+                self._pos = 0
+                return
+        raise EOFError('Response ended before the end of the data.')
+
+    def read_header(self):
+        """
+        Read the DDS header. The chunks are buffered only until
+        the header is found.
+        """
+        buffer = ''
+        while True:
+            index = buffer.find(DATA_MARKER)
+            if index >= 0:
+                self._buffer = buffer
+                self._pos = index + len(DATA_MARKER)
+                return buffer[:index]
+            try:
+                self._fill()
+            except EOFError:
+                raise ValueError('No data found in response.')
+            buffer += self._buffer
+
+    def readinto(self, buf):
+        """
+        Fill the contiguous array `buf` with the next bytes of the response.
+        """
+        view = buf.reshape(-1).view('B')
+        size = len(view)
+        pos = 0
+        while pos < size:
+            if self._pos == len(self._buffer):
+                self._fill()
+            count = min(size - pos, len(self._buffer) - self._pos)
+            view[pos:pos + count] = np.frombuffer(self._buffer, dtype='B',
+                                                  count=count,
+                                                  offset=self._pos)
+            self._pos += count
+            pos += count
+
+    def read(self, size=None):
+        """
+        Read `size` bytes or, by default, the rest of the response.
+        """
+        if size is None:
+            return self._buffer[self._pos:] + ''.join(self._chunks)
+        out = np.empty(size, dtype='B')
+        self.readinto(out)
+        return out.tostring()
+
+
+def unpack_stream(reader, dataset, targets=None):
+    """
+    Decode the XDR data following the header read from `reader`.
+
+    `targets` maps variable ids to arrays that the data of those variables
+    is decoded into, instead of newly allocated arrays. Returns the same
+    nested structure as unpack.
+    """
+    if not is_vectorizable(dataset):
+        return DapUnpacker(reader.read(), dataset).getvalue()
+    return _unpack_stream(reader, dataset, targets or {})
+
+
+def _unpack_stream(reader, var, targets):
+    if isinstance(var, StructureType):
+        return tuple(_unpack_stream(reader, child, targets)
+                     for child in var.walk())
+
+    dtype = wire_dtype(var.type)
+    count = 1
+    if var.shape:
+        count = int(np.frombuffer(reader.read(8), dtype='>u4')[0])
+
+    out = targets.get(var.id)
+    if out is None:
+        out = np.empty(var.shape, dtype=dtype)
+    if out.size != count:
+        raise ValueError('Variable %s has %d values in the response '
+                         'but %d were expected.' % (var.id, count, out.size))
+    if out.dtype == dtype and out.flags.c_contiguous:
+        reader.readinto(out)
+    else:
+        _convert_stream(reader, out, dtype)
+    if var.type == Byte:
+        # Bytes are padded to 4n:
+        reader.read(-count % 4)
+
+    if var.shape:
+        return out
+    return out.reshape(-1)[0]
+
+
+def _convert_stream(reader, out, dtype):
+    # Decode chunk by chunk into an array that does not have the layout
+    # of the wire, without a temporary copy of the whole array:
+    flat = out.reshape(-1) if out.flags.c_contiguous else out.flat
+    step = max(1, CHUNK_SIZE // dtype.itemsize)
+    for start in xrange(0, out.size, step):
+        stop = min(start + step, out.size)
+        flat[start:stop] = np.frombuffer(reader.read((stop - start) * dtype.itemsize),
+                                         dtype=dtype)
@@ -0,0 +1,200 @@
+"""
+Retries of failed requests, with exponential backoff, and per-host
+circuit breakers.
+
+Requests that fail with a connection error, a timeout, a truncated
+response or a status that indicates an overloaded server are retried
+after a random wait whose bound doubles at each attempt. A Retry-After
+header sent by the server is honoured. After several consecutive
+failures, requests to a host fail immediately with CircuitOpenError
+until the host is tried again.
+"""
+
+import time
+import random
+import threading
+from email.utils import parsedate_tz, mktime_tz
+from urlparse import urlsplit
+
+import requests
+
+__all__ = ['RetryPolicy', 'CircuitOpenError']
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised without sending a request to a host that is considered down.
+    """
+
+
+class RetryPolicy(object):
+    """
+    How failed requests are retried.
+
+    A policy can be shared by several datasets, which then share its
+    circuit breakers.
+
+    Parameters
+    ----------
+
+    max_retries : int, optional
+        Number of retries of a request.
+        Default: 3.
+    backoff_factor : float, optional
+        Retry n waits a random time of at most backoff_factor * 2**n seconds.
+        Default: 0.5.
+    max_backoff : float, optional
+        Longest wait in seconds, including waits asked by Retry-After.
+        Default: 60.
+    statuses : tuple of int, optional
+        HTTP statuses that are retried.
+        Default: (429, 500, 502, 503, 504).
+    failure_threshold : int, optional
+        Consecutive failures after which requests to a host fail
+        immediately. None disables the circuit breakers.
+        Default: 5.
+    reset_after : float, optional
+        Seconds after which a request is sent again to a host
+        that failed.
+        Default: 30.
+    """
+    def __init__(self, max_retries=3, backoff_factor=0.5, max_backoff=60,
+                 statuses=(429, 500, 502, 503, 504), failure_threshold=5,
+                 reset_after=30):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.statuses = statuses
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._breakers = dict()
+        self._lock = threading.Lock()
+
+    def call(self, url, function):
+        """
+        Call `function`, which sends a GET request to `url`, until it
+        succeeds or fails with an error that is not retried.
+        """
+        breaker = self._breaker(urlsplit(url).netloc)
+        attempt = 0
+        while True:
+            breaker.before_request()
+            try:
+                result = function()
+            except Exception as e:
+                if not self.is_retryable(e):
+                    raise
+                breaker.failure()
+                if attempt >= self.max_retries:
+                    raise
+                wait = self.backoff(attempt, _retry_after(e))
+            else:
+                breaker.success()
+                return result
+            time.sleep(wait)
+            attempt += 1
+
+    def is_retryable(self, error):
+        if isinstance(error, (CircuitOpenError,
+                              requests.exceptions.SSLError)):
+            return False
+        return _is_server_failure(error, self.statuses)
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Seconds to wait before retry `attempt`, starting at 0.
+        """
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff,
+                                     self.backoff_factor * 2 ** attempt))
+
+    def __getstate__(self):
+        # Circuit breakers are not shared with other processes:
+        state = self.__dict__.copy()
+        del state['_breakers'], state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._breakers = dict()
+        self._lock = threading.Lock()
+
+    def _breaker(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = _CircuitBreaker(host,
+                                                       self.failure_threshold,
+                                                       self.reset_after)
+            return self._breakers[host]
+
+
+def call(policy, url, function):
+    """
+    Call `function` with `policy`, or once if `policy` is None.
+    """
+    if policy is None:
+        return function()
+    return policy.call(url, function)
+
+
+class _CircuitBreaker(object):
+    def __init__(self, host, failure_threshold, reset_after):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened = None
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        if self.failure_threshold is None:
+            return
+        with self._lock:
+            if self.failures < self.failure_threshold:
+                return
+            now = time.time()
+            if now - self.opened < self.reset_after:
+                raise CircuitOpenError('%s failed %d times in a row; not '
+                                       'retrying before %.0f s' %
+                                       (self.host, self.failures,
+                                        self.opened + self.reset_after - now))
+            # Let this request through and keep the others waiting
+            # until it completes:
+            self.opened = now
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self.opened = time.time()
+
+
+def _is_server_failure(error, statuses):
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        return response is not None and response.status_code in statuses
+    return isinstance(error, (requests.exceptions.ConnectionError,
+                              requests.exceptions.Timeout,
+                              requests.exceptions.ChunkedEncodingError,
+                              EOFError))
+
+
+def _retry_after(error):
+    """
+    Seconds asked by the Retry-After header of a failed response.
+    """
+    response = getattr(error, 'response', None)
+    if response is None or 'Retry-After' not in response.headers:
+        return None
+    value = response.headers['Retry-After'].strip()
+    if value.isdigit():
+        return float(value)
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0.0, mktime_tz(date) - time.time())
@@ -11,7 +11,8 @@ import logging
 import requests
 import requests_cache
 
-def create_single_session(cache=None, expire_after=datetime.timedelta(hours=1), **kwargs):
+def create_single_session(cache=None, expire_after=datetime.timedelta(hours=1),
+                          pool_maxsize=None, **kwargs):
     # pylint: disable=unused-argument
     """
     Create a single session, possibly cached.
@@ -25,6 +26,11 @@ def create_single_session(cache=None, expire_after=datetime.timedelta(hours=1),
     expire_after : datetime.timedelta, optional
         How long cached data is kept, is a cache is used.
         Default: 1 hour.
+    pool_maxsize : int, optional
+        Maximum number of connections kept alive for each host.
+        Requests block until a connection is returned to the pool
+        rather than opening more than this number of connections.
+        Default: requests' own pooling.
     """
     # Credentials openid,username and password are accepted only for compatibility
     # purposes
@@ -42,4 +48,10 @@ def create_single_session(cache=None, expire_after=datetime.timedelta(hours=1),
     else:
         #Create a phony in-memory cached session and disable it:
         session = requests.Session()
+
+    if pool_maxsize is not None:
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_maxsize,
+                                                pool_block=True)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
     return session
@@ -0,0 +1,190 @@
+"""
+Counters and timings of requests.
+
+Every Dataset records its requests in its own Stats, which forwards them
+to the process-wide `process_stats`. The following are recorded:
+
+Counters:
+
+    requests.<kind>     requests sent, where kind is dds, das, dods or other
+    errors.<kind>       requests that raised an error
+    bytes.<kind>        bytes of response bodies, once decompressed
+    wire_bytes.<kind>   bytes of response bodies as received, compressed
+                        if the server compressed them
+    cache_hits          responses served by requests_cache
+    cache_misses        responses not served by requests_cache
+
+Timings, in seconds:
+
+    time_to_first_byte.<kind>   until the response headers are received
+    download.<kind>             until the body of a non-streamed response
+                                is received
+    parse.dds, parse.das        parsing of the DDS and DAS
+    decode                      download and decoding of a data response
+
+Hooks are called with the name, the value and a dict of tags, which
+include the url, for every value recorded. They can forward values to a
+metrics exporter::
+
+    netcdf4_pydap.stats.process_stats.add_hook(
+        lambda name, value, tags: statsd.timing(name, value))
+"""
+
+import bisect
+import time
+import threading
+import contextlib
+import warnings
+from collections import OrderedDict
+
+__all__ = ['Stats', 'Timing', 'process_stats']
+
+# Upper bounds, in seconds, of the histogram buckets of timings:
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+
+class Stats(object):
+    """
+    Counters and timing histograms.
+
+    Parameters
+    ----------
+
+    parent : Stats, optional
+        Stats to which recorded values are also forwarded.
+        Default: None.
+    """
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.counters = dict()
+        self.timings = dict()
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1, tags=None):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self._forward('count', name, value, tags)
+
+    def time(self, name, seconds, tags=None):
+        with self._lock:
+            if name not in self.timings:
+                self.timings[name] = Timing()
+            self.timings[name].add(seconds)
+        self._forward('time', name, seconds, tags)
+
+    @contextlib.contextmanager
+    def timer(self, name, tags=None):
+        """
+        Record the time spent in a with block.
+        """
+        start = time.time()
+        yield
+        self.time(name, time.time() - start, tags)
+
+    def add_hook(self, hook):
+        """
+        Call `hook(name, value, tags)` for every value recorded. Exceptions
+        raised by the hook are turned into warnings.
+        """
+        with self._lock:
+            self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        with self._lock:
+            self._hooks.remove(hook)
+
+    def _forward(self, method, name, value, tags):
+        for hook in list(self._hooks):
+            try:
+                hook(name, value, tags or {})
+            except Exception as e:
+                # A faulty hook must not fail the read being recorded:
+                warnings.warn('Stats hook %r failed: %r' % (hook, e),
+                              RuntimeWarning)
+        if self.parent is not None:
+            getattr(self.parent, method)(name, value, tags)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.timings.clear()
+
+    def snapshot(self):
+        """
+        Return the counters and a summary of the timings.
+        """
+        with self._lock:
+            return {'counters': OrderedDict(sorted(self.counters.items())),
+                    'timings': OrderedDict((name, self.timings[name].summary())
+                                           for name in sorted(self.timings))}
+
+    def __repr__(self):
+        snapshot = self.snapshot()
+        lines = ['%s: %s' % item for item in snapshot['counters'].items()]
+        lines.extend('%s: %d in %.3f s (mean %.3f s, max %.3f s)' %
+                     (name, summary['count'], summary['total'],
+                      summary['mean'], summary['max'])
+                     for name, summary in snapshot['timings'].items())
+        return '<%s\n%s>' % (self.__class__.__name__, '\n'.join(lines))
+
+
+class Timing(object):
+    """
+    A histogram of durations.
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def summary(self):
+        return {'count': self.count,
+                'total': self.total,
+                'mean': self.total / self.count if self.count else 0.0,
+                'min': self.min,
+                'max': self.max,
+                'buckets': OrderedDict(zip(BUCKETS + (float('inf'),),
+                                           self.buckets))}
+
+
+process_stats = Stats()
+
+
+def counted(chunks, stats, name, tags=None):
+    """
+    Yield `chunks`, counting their bytes in `stats` if it is not None.
+    """
+    for chunk in chunks:
+        if stats is not None:
+            stats.count(name, len(chunk), tags)
+        yield chunk
+
+
+def count_wire_bytes(stats, response, kind, tags=None):
+    """
+    Count the bytes of `response` read from the network so far.
+    """
+    tell = getattr(response.raw, 'tell', None)
+    if stats is not None and tell is not None:
+        stats.count('wire_bytes.' + kind, tell(), tags)
+
+
+def request_kind(url):
+    """
+    The kind of an OPeNDAP request: dds, das, dods or other.
+    """
+    path = url.split('?', 1)[0]
+    extension = path.rsplit('.', 1)[-1]
+    if extension in ('dds', 'das', 'dods'):
+        return extension
+    return 'other'
@@ -0,0 +1,270 @@
+"""
+Fixtures for tests that run against a local OPeNDAP server.
+
+The server is a threaded HTTP/1.1 server wrapping the pydap
+SimpleHandler so that keep-alive connections are honoured.
+"""
+import threading
+import time
+import zlib
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+
+import numpy as np
+import pytest
+
+from pydap.model import DatasetType, BaseType, GridType, Float32, Float64
+from pydap.handlers.lib import SimpleHandler
+
+
+def synthetic_dataset(ntime=4, nlat=3, nlon=5):
+    """
+    A small CMIP-like dataset with a `tas` grid and its coordinates.
+    """
+    dataset = DatasetType('test')
+    dataset.attributes['NC_GLOBAL'] = {'title': 'synthetic'}
+    dataset.attributes['DODS_EXTRA'] = {'Unlimited_Dimension': 'time'}
+    shape = (ntime, nlat, nlon)
+    dims = ('time', 'lat', 'lon')
+    tas = GridType('tas', attributes={'units': 'K'})
+    tas['tas'] = BaseType('tas',
+                          np.arange(np.prod(shape), dtype='>f4').reshape(shape),
+                          shape=shape, dimensions=dims, type=Float32)
+    for dim, length in zip(dims, shape):
+        tas[dim] = BaseType(dim, np.arange(length, dtype='>f8'),
+                            shape=(length,), dimensions=(dim,), type=Float64)
+    dataset['tas'] = tas
+    for dim, length in zip(dims, shape):
+        dataset[dim] = BaseType(dim, np.arange(length, dtype='>f8'),
+                                shape=(length,), dimensions=(dim,),
+                                type=Float64)
+    dataset._set_id()
+    return dataset
+
+
+class _WSGIRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Buffer responses so that headers and body are sent together:
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        environ = {'REQUEST_METHOD': 'GET',
+                   'PATH_INFO': path,
+                   'QUERY_STRING': query,
+                   'SERVER_NAME': '127.0.0.1',
+                   'SERVER_PORT': str(self.server.server_port),
+                   'wsgi.input': StringIO(''),
+                   'wsgi.errors': StringIO(),
+                   'wsgi.url_scheme': 'http'}
+        for key, value in self.headers.items():
+            environ['HTTP_' + key.upper().replace('-', '_')] = value
+        status_headers = []
+
+        def start_response(status, headers, exc_info=None):
+            status_headers[:] = [status, headers]
+
+        body = ''.join(self.server.app(environ, start_response))
+        status, headers = status_headers
+        with self.server.lock:
+            self.server.requests += 1
+        self.send_response(int(status.split()[0]))
+        for key, value in headers:
+            if key.lower() != 'content-length':
+                self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        if self.headers.get('connection', '').lower() == 'close':
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, app):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _WSGIRequestHandler)
+        self.app = app
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.url = 'http://127.0.0.1:%d/test' % self.server_port
+
+
+class FaultyApp(object):
+    """
+    Wrap a WSGI application to delay responses or return an
+    HTTP error, depending on the response extension (dds, das, dods).
+    With an etag, conditional requests are answered.
+    """
+    def __init__(self, app, delay=None, errors=None, etag=None):
+        self.app = app
+        self.delay = delay or {}
+        self.errors = errors or {}
+        self.etag = etag
+
+    def __call__(self, environ, start_response):
+        extension = environ['PATH_INFO'].rsplit('.', 1)[-1]
+        time.sleep(self.delay.get(extension, 0))
+        if extension in self.errors:
+            start_response(self.errors[extension],
+                           [('Content-type', 'text/plain')])
+            return [self.errors[extension]]
+        if self.etag is None:
+            return self.app(environ, start_response)
+        if environ.get('HTTP_IF_NONE_MATCH') == self.etag:
+            start_response('304 Not Modified', [('ETag', self.etag)])
+            return []
+
+        def start_response_with_etag(status, headers, exc_info=None):
+            return start_response(status, headers + [('ETag', self.etag)],
+                                  exc_info)
+        return self.app(environ, start_response_with_etag)
+
+
+class FlakyApp(object):
+    """
+    Answer 503 with a Retry-After header to the first `failures` requests
+    with the given extension, or to any request if it is None.
+    """
+    def __init__(self, app, failures, extension=None):
+        self.app = app
+        self.failures = failures
+        self.extension = extension
+        self.lock = threading.Lock()
+        self.failed = 0
+
+    def __call__(self, environ, start_response):
+        extension = environ['PATH_INFO'].rsplit('.', 1)[-1]
+        if self.extension is None or extension == self.extension:
+            with self.lock:
+                fail = self.failed < self.failures
+                if fail:
+                    self.failed += 1
+            if fail:
+                start_response('503 Service Unavailable',
+                               [('Content-type', 'text/plain'),
+                                ('Retry-After', '0')])
+                return ['503 Service Unavailable']
+        return self.app(environ, start_response)
+
+
+class GzipApp(object):
+    """
+    Compress responses when the request accepts gzip. The accepted
+    encodings of each request are recorded.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.lock = threading.Lock()
+        self.accepted = []
+
+    def __call__(self, environ, start_response):
+        accepted = environ.get('HTTP_ACCEPT_ENCODING', '')
+        with self.lock:
+            self.accepted.append(accepted)
+        if 'gzip' not in accepted:
+            return self.app(environ, start_response)
+        captured = []
+
+        def capture(status, headers, exc_info=None):
+            captured.append((status, headers))
+        body = ''.join(self.app(environ, capture))
+        status, headers = captured[0]
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        body = compressor.compress(body) + compressor.flush()
+        headers = [(name, value) for name, value in headers
+                   if name.lower() != 'content-length']
+        start_response(status, headers + [('Content-Encoding', 'gzip'),
+                                          ('Content-Length', str(len(body)))])
+        return [body]
+
+
+class FileApp(object):
+    """
+    Serve a file, with byte ranges if `ranges` is set.
+    """
+    def __init__(self, content, ranges=True):
+        self.content = content
+        self.ranges = ranges
+        self.lock = threading.Lock()
+        self.requested = []
+
+    def __call__(self, environ, start_response):
+        headers = [('Content-type', 'application/x-netcdf')]
+        if not self.ranges or 'HTTP_RANGE' not in environ:
+            with self.lock:
+                self.requested.append(None)
+            if self.ranges:
+                headers.append(('Accept-Ranges', 'bytes'))
+            start_response('200 OK', headers)
+            return [self.content]
+        start, stop = environ['HTTP_RANGE'].split('=')[1].split('-')
+        start, stop = int(start), int(stop) + 1
+        with self.lock:
+            self.requested.append(start)
+        headers.append(('Content-Range', 'bytes %d-%d/%d' %
+                        (start, stop - 1, len(self.content))))
+        start_response('206 Partial Content', headers)
+        return [self.content[start:stop]]
+
+
+class AuthApp(object):
+    """
+    Answer 401 to requests without the cookie set by the login page.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.lock = threading.Lock()
+        self.token = 'v1'
+        self.logins = 0
+        self.paths = []
+
+    def __call__(self, environ, start_response):
+        with self.lock:
+            self.paths.append(environ['PATH_INFO'])
+        if environ['PATH_INFO'] == '/login':
+            with self.lock:
+                self.logins += 1
+            start_response('200 OK', [('Content-type', 'text/html'),
+                                      ('Set-Cookie',
+                                       'token=%s; Path=/' % self.token)])
+            return ['<html><body>Logged in</body></html>']
+        if 'token=%s' % self.token not in environ.get('HTTP_COOKIE', ''):
+            start_response('401 Unauthorized',
+                           [('Content-type', 'text/plain')])
+            return ['401 Unauthorized']
+        if '.' not in environ['PATH_INFO']:
+            # The page of the dataset, probed after logging in:
+            start_response('200 OK', [('Content-type', 'text/html')])
+            return ['<html><body>Dataset</body></html>']
+        return self.app(environ, start_response)
+
+
+def start_server(app):
+    server = LocalServer(app)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def opendap_server():
+    server = start_server(SimpleHandler(synthetic_dataset()))
+    yield server
+    stop_server(server)
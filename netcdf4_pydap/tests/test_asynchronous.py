@@ -0,0 +1,46 @@
+"""
+Test module for the non-blocking API.
+
+"""
+import numpy as np
+import pytest
+from pydap.exceptions import ServerError
+from pydap.handlers.lib import SimpleHandler
+
+import netcdf4_pydap
+from conftest import FaultyApp, start_server, stop_server, synthetic_dataset
+
+
+def test_concurrent_reads(opendap_server):
+    """
+    Test opening and reading several datasets concurrently.
+    """
+    expected = np.arange(60).reshape(4, 3, 5)
+    datasets = [netcdf4_pydap.AsyncDataset(opendap_server.url)
+                for index in range(8)]
+    reads = [dataset['tas'].read((index % 4, slice(None), slice(None)))
+             for index, dataset in enumerate(datasets)]
+    fetch = datasets[0].fetch({'lat': slice(None), 'lon': 1})
+    for index, read in enumerate(reads):
+        assert (read.get() == expected[index % 4:index % 4 + 1]).all()
+    assert (fetch.get()['lat'] == np.arange(3)).all()
+    for dataset in datasets:
+        dataset.close().get()
+        assert not dataset.result().isopen()
+
+
+def test_open_error():
+    """
+    Test that errors are raised when results are retrieved.
+    """
+    app = FaultyApp(SimpleHandler(synthetic_dataset()),
+                    errors={'dds': '500 Internal Server Error'})
+    server = start_server(app)
+    try:
+        dataset = netcdf4_pydap.AsyncDataset(server.url)
+        read = dataset['tas'].read()
+        with pytest.raises(ServerError):
+            read.get()
+        assert dataset.ready()
+    finally:
+        stop_server(server)
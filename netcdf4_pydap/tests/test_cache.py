@@ -0,0 +1,105 @@
+"""
+Test module for the block cache.
+
+"""
+import numpy as np
+from pydap.handlers.lib import SimpleHandler
+
+import netcdf4_pydap
+from netcdf4_pydap.requests_pydap import cache
+from conftest import FaultyApp, start_server, stop_server, synthetic_dataset
+
+
+def test_subslice():
+    """
+    Test the lookup of hyperslabs in cached blocks.
+    """
+    block = ((2, 5, 2), (0, 4, 1))
+    assert (cache._subslice(((4, 2, 4), (1, 2, 1)), block) ==
+            (slice(1, 4, 2), slice(1, 3, 1)))
+    # Not aligned with the block stride:
+    assert cache._subslice(((3, 1, 1), (0, 4, 1)), block) is None
+    # Outside of the block:
+    assert cache._subslice(((10, 2, 2), (0, 4, 1)), block) is None
+
+
+def test_eviction():
+    """
+    Test that least recently used blocks are evicted.
+    """
+    block_cache = cache.BlockCache(max_size=2 * 80)
+    shape = (100,)
+    for start in [0, 10, 20]:
+        block_cache.put('url', 'x', (slice(start, start + 10, 1),), shape,
+                        np.arange(start, start + 10, dtype='f8'))
+    assert block_cache.size == 2 * 80
+    assert block_cache.get('url', 'x', (slice(0, 5, 1),), shape) is None
+    assert (block_cache.get('url', 'x', (slice(12, 15, 1),), shape) ==
+            [12, 13, 14]).all()
+    assert block_cache.hits == 1
+    assert block_cache.misses == 1
+
+
+def test_cached_reads(opendap_server):
+    """
+    Test that reads of subsets of a cached block are served locally.
+    """
+    expected = np.arange(60).reshape(4, 3, 5)
+    block_cache = netcdf4_pydap.BlockCache()
+    with netcdf4_pydap.Dataset(opendap_server.url,
+                               block_cache=block_cache) as dataset:
+        tas = dataset.variables['tas']
+        assert (tas[:, :, :] == expected).all()
+        requests = opendap_server.requests
+        data = tas[1:3, 1, ::2]
+        data[...] = -1
+        assert (tas[1:3, 1, ::2] == expected[1:3, 1:2, ::2]).all()
+        assert opendap_server.requests == requests
+    assert block_cache.hits == 2
+    assert block_cache.misses == 1
+
+
+def test_metadata_cache(opendap_server, tmpdir):
+    """
+    Test that fresh entries are used without contacting the server.
+    """
+    metadata_cache = netcdf4_pydap.MetadataCache(str(tmpdir))
+    with netcdf4_pydap.Dataset(opendap_server.url,
+                               metadata_cache=metadata_cache) as dataset:
+        expected = repr(dataset)
+    assert opendap_server.requests == 2
+    with netcdf4_pydap.Dataset(opendap_server.url,
+                               metadata_cache=metadata_cache) as dataset:
+        assert repr(dataset) == expected
+        assert dataset.variables['tas'].units == 'K'
+        assert opendap_server.requests == 2
+        assert (dataset.variables['tas'][1, 1, :] ==
+                np.arange(60).reshape(4, 3, 5)[1, 1, :]).all()
+
+
+def test_metadata_cache_revalidation(tmpdir):
+    """
+    Test that expired entries are revalidated with their ETag.
+    """
+    app = FaultyApp(SimpleHandler(synthetic_dataset()), etag='"v1"')
+    server = start_server(app)
+    try:
+        metadata_cache = netcdf4_pydap.MetadataCache(str(tmpdir),
+                                                     expire_after=0)
+        for repeat in range(2):
+            with netcdf4_pydap.Dataset(server.url,
+                                       metadata_cache=metadata_cache) as dataset:
+                assert dataset.variables['tas'].units == 'K'
+        # The second open only revalidated the DDS:
+        assert server.requests == 3
+        app.etag = '"v2"'
+        with netcdf4_pydap.Dataset(server.url,
+                                   metadata_cache=metadata_cache) as dataset:
+            assert dataset.variables['tas'].units == 'K'
+        # The changed DDS was reused, only the DAS was requested again:
+        assert server.requests == 5
+        # The new ETag was saved:
+        netcdf4_pydap.Dataset(server.url, metadata_cache=metadata_cache).close()
+        assert server.requests == 6
+    finally:
+        stop_server(server)
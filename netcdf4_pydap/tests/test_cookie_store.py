@@ -0,0 +1,53 @@
+"""
+Test module for the store of authentication cookies.
+
+"""
+import threading
+
+import numpy as np
+from pydap.handlers.lib import SimpleHandler
+
+import netcdf4_pydap
+from conftest import AuthApp, start_server, stop_server, synthetic_dataset
+
+
+def test_single_login(tmpdir):
+    """
+    Test that concurrent opens and separate stores log in once,
+    and that stale cookies are replaced.
+    """
+    app = AuthApp(SimpleHandler(synthetic_dataset()))
+    server = start_server(app)
+    login_url = server.url.replace('/test', '/login')
+    credentials = {'authentication_url': login_url, 'password': 'secret'}
+
+    def open_dataset():
+        # A store per thread, as in separate processes:
+        store = netcdf4_pydap.CookieStore(str(tmpdir))
+        with netcdf4_pydap.Dataset(server.url, cookie_store=store,
+                                   **credentials) as dataset:
+            assert (dataset.variables['lat'][:] == np.arange(3)).all()
+
+    try:
+        threads = [threading.Thread(target=open_dataset) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert app.logins == 1
+
+        # Stored cookies are used without a failed request:
+        requests = server.requests
+        open_dataset()
+        assert app.logins == 1
+        assert server.requests == requests + 3
+
+        # Rejected cookies lead to a new login:
+        app.token = 'v2'
+        open_dataset()
+        assert app.logins == 2
+
+        netcdf4_pydap.CookieStore(str(tmpdir)).clear()
+        assert tmpdir.listdir() == []
+    finally:
+        stop_server(server)
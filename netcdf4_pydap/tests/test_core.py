@@ -4,6 +4,7 @@ Test module for CAS
 """
 import os
 import requests
+import numpy as np
 import netcdf4_pydap
 
 
@@ -51,3 +52,34 @@ def test_content_description():
         pass
     except:
         assert(False)
+
+
+def test_dimensions_and_variables(opendap_server):
+    """
+    Test the lazily built dimensions and variables.
+    """
+    with netcdf4_pydap.Dataset(opendap_server.url) as dataset:
+        assert list(dataset.dimensions) == ['time', 'lat', 'lon']
+        assert dataset.dimensions['time'].isunlimited()
+        assert len(dataset.dimensions['lon']) == 5
+        assert sorted(dataset.variables) == ['lat', 'lon', 'tas', 'time']
+        assert 'tas' in dataset.variables
+        assert 'pr' not in dataset.variables
+        assert dataset.variables['tas'] is dataset['tas']
+        assert dataset.variables['tas'].dimensions == ('time', 'lat', 'lon')
+
+
+def test_fetch(opendap_server):
+    """
+    Test reading several variables in one request.
+    """
+    with netcdf4_pydap.Dataset(opendap_server.url) as dataset:
+        requests = opendap_server.requests
+        data = dataset.fetch({'tas': (slice(1, 3), 0, slice(None, None, 2)),
+                              'lat': slice(1, None),
+                              'time': Ellipsis})
+        assert opendap_server.requests == requests + 1
+    expected = np.arange(60).reshape(4, 3, 5)
+    assert (data['tas'] == expected[1:3, 0:1, ::2]).all()
+    assert (data['lat'] == [1, 2]).all()
+    assert (data['time'] == np.arange(4)).all()
@@ -0,0 +1,118 @@
+"""
+Test module for dask arrays of variables.
+
+"""
+import cPickle as pickle
+
+import numpy as np
+import pytest
+
+from pydap.model import BaseType, Int16
+from pydap.handlers.lib import SimpleHandler
+
+import netcdf4_pydap
+from netcdf4_pydap import dask_array
+from netcdf4_pydap.dask_array import _Source, _CONFIG, default_chunks
+from conftest import start_server, stop_server, synthetic_dataset
+
+try:
+    import dask
+except ImportError:
+    # Sources are tested without dask:
+    dask = None
+
+
+def test_to_dask(opendap_server):
+    pytest.importorskip('dask')
+    with netcdf4_pydap.Dataset(opendap_server.url) as dataset:
+        array = dataset.variables['tas'].to_dask(chunks=(1, 3, 5))
+    assert array.chunks == ((1, 1, 1, 1), (3,), (5,))
+    # Tasks open the dataset again:
+    assert (array.mean(axis=0).compute(scheduler='threads') ==
+            np.arange(60).reshape(4, 3, 5).mean(axis=0)).all()
+    assert (array[1:3, :, 2].compute() ==
+            np.arange(60).reshape(4, 3, 5)[1:3, :, 2]).all()
+    pickle.dumps(dict(array.__dask_graph__()), pickle.HIGHEST_PROTOCOL)
+
+
+def test_source(opendap_server):
+    """
+    Test that the source of the chunks pickles without the session.
+    """
+    retry = netcdf4_pydap.RetryPolicy()
+    with netcdf4_pydap.Dataset(opendap_server.url, retry=retry) as dataset:
+        config = dict((name, getattr(dataset, name)) for name in _CONFIG)
+        source = _Source(dataset.filepath(), 'tas', (4, 3, 5),
+                         dataset.variables['tas'].dtype, config)
+    source = pickle.loads(pickle.dumps(source, pickle.HIGHEST_PROTOCOL))
+    assert (source[1:3, :, 2:4] ==
+            np.arange(60).reshape(4, 3, 5)[1:3, :, 2:4]).all()
+    assert source[0:0, :, :].shape == (0, 3, 5)
+    assert (source[2, 1, :] == np.arange(60).reshape(4, 3, 5)[2, 1, :]).all()
+
+
+def test_shared_dataset(opendap_server):
+    """
+    Test that sources of the same dataset read it with one Dataset.
+    """
+    with netcdf4_pydap.Dataset(opendap_server.url) as dataset:
+        config = dict((name, getattr(dataset, name)) for name in _CONFIG)
+        sources = [pickle.loads(pickle.dumps(
+                       _Source(dataset.filepath(), name,
+                               dataset.variables[name].shape,
+                               dataset.variables[name].dtype, config)))
+                   for name in ['time', 'time', 'lat']]
+    opened = len(dask_array._datasets)
+    for source in sources:
+        source[0:2]
+    assert len(dask_array._datasets) == opened + 1
+    assert len(set(id(source._dataset()) for source in sources)) == 1
+
+
+def test_default_chunks():
+    assert default_chunks((4, 3, 5), 4) == (4, 3, 5)
+    assert default_chunks((4, 3, 5), 4, target_size=120) == (2, 3, 5)
+    assert default_chunks((4, 3, 5), 4, target_size=40) == (1, 2, 5)
+    assert default_chunks((4, 3, 5), 4, target_size=4) == (1, 1, 1)
+
+
+@pytest.fixture
+def packed_server():
+    """
+    A server with a packed `pr` variable.
+    """
+    dataset = synthetic_dataset()
+    packed = np.arange(20, dtype='>i2').reshape(4, 5)
+    packed[1, 2] = -1
+    dataset['pr'] = BaseType('pr', packed, shape=packed.shape,
+                             dimensions=('time', 'lon'), type=Int16,
+                             attributes={'_FillValue': -1,
+                                         'scale_factor': 0.5,
+                                         'add_offset': 10.0})
+    dataset._set_id()
+    server = start_server(SimpleHandler(dataset))
+    yield server
+    stop_server(server)
+
+
+def test_maskandscale(packed_server):
+    """
+    Test that chunks are masked and scaled as the variable reads them.
+    """
+    with netcdf4_pydap.Dataset(packed_server.url) as dataset:
+        pr = dataset.variables['pr']
+        pr.set_auto_maskandscale(True)
+        expected = pr[...]
+        config = dict((name, getattr(dataset, name)) for name in _CONFIG)
+        source = _Source(dataset.filepath(), 'pr', pr.shape, expected.dtype,
+                         config, mask=True, scale=True)
+        result = source[1:3, :]
+        assert result.mask.sum() == 1 and result.mask[0, 2]
+        assert np.ma.allclose(result, expected[1:3])
+
+        if dask is not None:
+            array = pr.to_dask(chunks=(1, 5))
+            assert array.dtype == expected.dtype
+            result = array.compute()
+            assert result.mask.sum() == 1 and result.mask[1, 2]
+            assert np.ma.allclose(result, expected)
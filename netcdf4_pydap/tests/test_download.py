@@ -0,0 +1,113 @@
+"""
+Test module for bulk downloads.
+
+"""
+import threading
+import time
+
+from netcdf4_pydap import download, RetryPolicy
+from conftest import FaultyApp, FileApp, FlakyApp, start_server, stop_server
+
+
+class CountingApp(object):
+    """
+    Record the largest number of simultaneous requests.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def __call__(self, environ, start_response):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(0.05)
+            return self.app(environ, start_response)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def test_download(tmpdir):
+    """
+    Test concurrent downloads from two hosts, with an existing
+    destination and a missing file.
+    """
+    apps = [CountingApp(FileApp('a' * 1000)), CountingApp(FileApp('b' * 500))]
+    servers = [start_server(app) for app in apps]
+    missing = start_server(FaultyApp(FileApp(''), errors={'nc': '404 Not Found'}))
+    manifest = [(servers[index % 2].url + '%d.nc' % index,
+                 str(tmpdir.join('%d.nc' % index)))
+                for index in range(8)]
+    manifest.append((missing.url + '.nc', str(tmpdir.join('missing.nc'))))
+    tmpdir.join('0.nc').write('done')
+    try:
+        report = download.download(manifest, max_workers=6, max_per_host=2)
+    finally:
+        for server in servers + [missing]:
+            stop_server(server)
+
+    assert report.skipped == [str(tmpdir.join('0.nc'))]
+    assert len(report.downloaded) == 7
+    assert [dest_name for dest_name, error in report.failed] == \
+        [str(tmpdir.join('missing.nc'))]
+    assert report.size == 3 * 1000 + 4 * 500
+    assert tmpdir.join('0.nc').read() == 'done'
+    assert tmpdir.join('1.nc').read() == 'b' * 500
+    assert not tmpdir.join('missing.nc').check()
+    assert [app.max_active for app in apps] == [2, 2]
+    assert '7 downloaded, 1 skipped, 1 failed' in str(report)
+
+
+def test_read_manifest():
+    """
+    Test the parsing of manifests.
+    """
+    lines = ['# comment\n', 'http://host/a.nc  out/a.nc\n', '\n',
+             'http://host/b.nc out/b c.nc\n']
+    assert download.read_manifest(lines) == [('http://host/a.nc', 'out/a.nc'),
+                                             ('http://host/b.nc', 'out/b c.nc')]
+
+
+class SlowApp(object):
+    """
+    Delay the first `delays` requests by `delay` seconds.
+    """
+    def __init__(self, app, delays, delay):
+        self.app = app
+        self.delays = delays
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        with self.lock:
+            slow = self.delays > 0
+            self.delays -= 1
+        if slow:
+            time.sleep(self.delay)
+        return self.app(environ, start_response)
+
+
+def test_download_retry(tmpdir):
+    """
+    Test that the first request of a file is retried when it times out
+    or fails.
+    """
+    apps = [SlowApp(FileApp('c' * 100), delays=1, delay=1),
+            FlakyApp(FileApp('d' * 100), failures=2)]
+    servers = [start_server(app) for app in apps]
+    manifest = [(servers[0].url + '.nc', str(tmpdir.join('c.nc'))),
+                (servers[1].url + '.nc', str(tmpdir.join('d.nc')))]
+    try:
+        report = download.download(manifest, timeout=0.3,
+                                   retry=RetryPolicy(max_retries=2,
+                                                     backoff_factor=0))
+    finally:
+        for server in servers:
+            stop_server(server)
+    assert report.failed == []
+    assert tmpdir.join('c.nc').read() == 'c' * 100
+    assert tmpdir.join('d.nc').read() == 'd' * 100
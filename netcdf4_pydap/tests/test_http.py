@@ -0,0 +1,163 @@
+"""
+Test module for the requests_pydap layer, against a local server.
+
+"""
+import os
+import time
+import threading
+
+import numpy as np
+import pytest
+from pydap.exceptions import ServerError
+from pydap.handlers.lib import SimpleHandler
+
+import netcdf4_pydap
+from conftest import (AuthApp, FaultyApp, GzipApp, start_server, stop_server,
+                      synthetic_dataset)
+
+
+def _open_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+
+def _wait_for_fds(expected, timeout=5.0):
+    # Server-side sockets are closed by the handler threads once
+    # the client hangs up:
+    start = time.time()
+    while _open_fds() > expected and time.time() - start < timeout:
+        time.sleep(0.05)
+    return _open_fds()
+
+
+def test_keep_alive_reuses_connection(opendap_server):
+    """
+    Test that a keep-alive dataset reuses its connections.
+    """
+    with netcdf4_pydap.Dataset(opendap_server.url, keep_alive=True) as dataset:
+        for step in range(12):
+            data = dataset.variables['tas'][step % 4, :, 1:3]
+    assert np.all(data == np.arange(60).reshape(4, 3, 5)[3:4, :, 1:3])
+    assert opendap_server.requests == 14
+    # The DDS and DAS are requested concurrently:
+    assert opendap_server.connections <= 2
+
+
+def test_keep_alive_no_fd_leak(opendap_server):
+    """
+    Regression test: keep-alive must not leak file descriptors.
+    """
+    baseline = _open_fds()
+    for repeat in range(5):
+        with netcdf4_pydap.Dataset(opendap_server.url,
+                                   keep_alive=True) as dataset:
+            for step in range(20):
+                dataset.variables['tas'][step % 4, ...]
+                dataset.variables['lat'][:]
+    assert _wait_for_fds(baseline) <= baseline
+
+
+def test_connection_close(opendap_server):
+    """
+    Test the default behaviour, one connection per request.
+    """
+    baseline = _open_fds()
+    with netcdf4_pydap.Dataset(opendap_server.url) as dataset:
+        for step in range(3):
+            dataset.variables['lat'][:]
+    assert opendap_server.connections == opendap_server.requests
+    assert _wait_for_fds(baseline) <= baseline
+
+
+def test_concurrent_dds_das():
+    """
+    Test that the DDS and DAS are requested concurrently.
+    """
+    app = FaultyApp(SimpleHandler(synthetic_dataset()),
+                    delay={'dds': 0.5, 'das': 0.5})
+    server = start_server(app)
+    try:
+        start = time.time()
+        with netcdf4_pydap.Dataset(server.url) as dataset:
+            elapsed = time.time() - start
+            assert dataset.variables['tas'].units == 'K'
+            assert len(dataset.dimensions['lon']) == 5
+    finally:
+        stop_server(server)
+    assert elapsed < 0.9
+
+
+def test_das_error():
+    """
+    Test that an error on the DAS is raised after the authentication retry.
+    """
+    app = FaultyApp(SimpleHandler(synthetic_dataset()),
+                    errors={'das': '403 Forbidden'})
+    server = start_server(app)
+    try:
+        with pytest.raises(ServerError) as excinfo:
+            netcdf4_pydap.Dataset(server.url)
+    finally:
+        stop_server(server)
+    assert '403' in str(excinfo.value)
+    # The DDS and DAS were both requested with and without authentication:
+    assert server.requests == 4
+
+
+def test_reauthentication():
+    """
+    Test that concurrent reads rejected with stale cookies share one
+    login and are retried without requesting the DDS and DAS again.
+    """
+    app = AuthApp(SimpleHandler(synthetic_dataset()))
+    server = start_server(app)
+    login_url = server.url.replace('/test', '/login')
+    expected = np.arange(60).reshape(4, 3, 5)
+    try:
+        with netcdf4_pydap.Dataset(server.url, authentication_url=login_url,
+                                   password='secret') as dataset:
+            tas = dataset.variables['tas']
+            assert app.logins == 1
+            app.token = 'v2'
+            del app.paths[:]
+            results = [None] * 8
+
+            def read(index):
+                results[index] = tas[index % 4]
+
+            threads = [threading.Thread(target=read, args=(index,))
+                       for index in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    finally:
+        stop_server(server)
+    for index, result in enumerate(results):
+        assert (result == expected[index % 4:index % 4 + 1]).all()
+    assert app.logins == 2
+    assert not [path for path in app.paths
+                if path.endswith('.dds') or path.endswith('.das')]
+
+
+@pytest.mark.parametrize('compression', [True, False])
+def test_compression(compression):
+    """
+    Test that compressed responses are decoded and counted.
+    """
+    app = GzipApp(SimpleHandler(synthetic_dataset(ntime=40)))
+    server = start_server(app)
+    try:
+        with netcdf4_pydap.Dataset(server.url,
+                                   compression=compression) as dataset:
+            data = dataset.variables['tas'][...]
+    finally:
+        stop_server(server)
+    assert (data == np.arange(600).reshape(40, 3, 5)).all()
+    counters = dataset.stats.counters
+    for kind in ['dds', 'das', 'dods']:
+        if compression:
+            assert counters['wire_bytes.' + kind] < counters['bytes.' + kind]
+        else:
+            assert counters['wire_bytes.' + kind] == counters['bytes.' + kind]
+    assert all(('gzip' in accepted) == compression
+               for accepted in app.accepted)
@@ -0,0 +1,78 @@
+"""
+Test module for file downloads.
+
+"""
+import os
+import json
+
+import numpy as np
+import pytest
+
+import netcdf4_pydap
+from conftest import FileApp, start_server, stop_server
+
+
+@pytest.fixture
+def content():
+    return np.random.RandomState(0).bytes(10000)
+
+
+def _wget(url, dest_name, **kwargs):
+    with netcdf4_pydap.http_Dataset(url) as dataset:
+        return dataset.wget(dest_name, **kwargs)
+
+
+def test_ranged_wget(tmpdir, content):
+    """
+    Test a download in ranges over several connections.
+    """
+    app = FileApp(content)
+    server = start_server(app)
+    dest_name = str(tmpdir.join('file.nc'))
+    try:
+        _wget(server.url, dest_name, max_connections=4, range_size=3000)
+    finally:
+        stop_server(server)
+    with open(dest_name, 'rb') as dest_file:
+        assert dest_file.read() == content
+    assert sorted(app.requested[1:]) == [0, 3000, 6000, 9000]
+    assert os.listdir(str(tmpdir)) == ['file.nc']
+
+
+def test_resume(tmpdir, content):
+    """
+    Test that completed ranges are not downloaded again.
+    """
+    app = FileApp(content)
+    server = start_server(app)
+    dest_name = str(tmpdir.join('file.nc'))
+    with open(dest_name + '.part', 'wb') as part_file:
+        part_file.write(content[:6000] + '\0' * 4000)
+    with open(dest_name + '.state', 'w') as state_file:
+        json.dump({'validator': {'url': server.url, 'size': 10000,
+                                 'etag': None, 'last_modified': None,
+                                 'range_size': 3000},
+                   'done': [0, 3000]}, state_file)
+    try:
+        _wget(server.url, dest_name, max_connections=4, range_size=3000)
+    finally:
+        stop_server(server)
+    with open(dest_name, 'rb') as dest_file:
+        assert dest_file.read() == content
+    assert sorted(app.requested[1:]) == [6000, 9000]
+
+
+def test_single_stream_fallback(tmpdir, content):
+    """
+    Test that files served without ranges are downloaded in one stream.
+    """
+    app = FileApp(content, ranges=False)
+    server = start_server(app)
+    dest_name = str(tmpdir.join('file.nc'))
+    try:
+        _wget(server.url, dest_name, max_connections=4, range_size=3000)
+    finally:
+        stop_server(server)
+    with open(dest_name, 'rb') as dest_file:
+        assert dest_file.read() == content
+    assert app.requested == [None]
@@ -0,0 +1,115 @@
+"""
+Test module for auto mask and scale.
+
+"""
+import numpy as np
+import pytest
+from pydap.model import BaseType, Int16
+from pydap.handlers.lib import SimpleHandler
+
+import netcdf4_pydap
+from netcdf4_pydap.maskandscale import Packing
+from conftest import start_server, stop_server, synthetic_dataset
+
+
+@pytest.fixture
+def packed_server():
+    """
+    A server with a packed `pr` variable.
+    """
+    dataset = synthetic_dataset()
+    packed = np.arange(20, dtype='>i2').reshape(4, 5)
+    packed[0, 0] = -1
+    packed[1, 2] = 30000
+    dataset['pr'] = BaseType('pr', packed, shape=packed.shape,
+                             dimensions=('time', 'lon'), type=Int16,
+                             attributes={'_FillValue': -1,
+                                         'valid_range': [0, 1000],
+                                         'scale_factor': np.float32(0.5),
+                                         'add_offset': np.float32(10)})
+    dataset._set_id()
+    server = start_server(SimpleHandler(dataset))
+    yield server
+    stop_server(server)
+
+
+def test_maskandscale(packed_server):
+    with netcdf4_pydap.Dataset(packed_server.url) as dataset:
+        # Off by default:
+        raw = dataset.variables['pr'][...]
+        assert raw.dtype.kind == 'i'
+        assert not np.ma.isMaskedArray(raw)
+
+        dataset.set_auto_maskandscale(True)
+        pr = dataset.variables['pr']
+        result = pr[...]
+        assert result.dtype.kind == 'f'
+        assert result.mask.sum() == 2
+        assert result.mask[0, 0] and result.mask[1, 2]
+        assert np.allclose(result[0, 1:], raw[0, 1:] * 0.5 + 10)
+
+        pr.set_auto_mask(False)
+        result = pr[1, :]
+        assert not np.ma.is_masked(result)
+        assert np.allclose(result, raw[1, :] * 0.5 + 10)
+
+        pr.set_auto_maskandscale(False)
+        pr.set_auto_mask(True)
+        result = pr[:2, :]
+        assert result.dtype == raw.dtype
+        assert (result == raw[:2]).all()
+        assert result.mask.sum() == 2
+
+        # Variables without missing values are masked arrays too:
+        dataset.set_auto_mask(True)
+        lat = dataset.variables['lat'][...]
+        assert np.ma.isMaskedArray(lat)
+        assert not np.ma.is_masked(lat)
+
+
+def test_maskandscale_reductions(packed_server):
+    with netcdf4_pydap.Dataset(packed_server.url) as dataset:
+        dataset.set_auto_maskandscale(True)
+        pr = dataset.variables['pr']
+        expected = pr[...]
+        for operation in ['sum', 'mean', 'min', 'max', 'count']:
+            for axis in [None, 1]:
+                # Blocks of one row:
+                result = getattr(pr, operation)(axis=axis, block_size=10)
+                assert np.ma.allclose(result,
+                                      getattr(expected, operation)(axis=axis))
+        counts, edges = pr.histogram(bins=4)
+        assert (counts == np.histogram(expected.compressed(), bins=4)[0]).all()
+
+        result = dataset.fetch({'pr': slice(0, 2)})['pr']
+        assert np.ma.allclose(result, expected[:2])
+        assert result.mask.sum() == 2
+
+
+class _Attributes(object):
+    def __init__(self, dtype, **attributes):
+        self.dtype = np.dtype(dtype)
+        self.attributes = attributes
+
+    def ncattrs(self):
+        return self.attributes.keys()
+
+    def getncattr(self, name):
+        return self.attributes[name]
+
+
+def test_packing():
+    packing = Packing(_Attributes('i1', _Unsigned='true', scale_factor=2.0))
+    data = np.array([-1, 0, 1], dtype='i1')
+    assert list(packing.scale(data)) == [510, 0, 2]
+
+    # Default fill value without _FillValue, as netCDF4-python:
+    packing = Packing(_Attributes('f4', missing_value=-99))
+    data = np.array([9.96921e+36, -99, np.nan, 1], dtype='f4')
+    assert list(packing.mask(data).mask) == [True, True, True, False]
+
+    # Floats are unpacked in place:
+    packing = Packing(_Attributes('f4', scale_factor=np.float32(2)))
+    data = np.ones(3, dtype='f4')
+    assert packing.scale(data) is data
+    assert (data == 2).all()
@@ -0,0 +1,87 @@
+"""
+Test module for the aggregation of datasets.
+
+"""
+import numpy as np
+import pytest
+from pydap.handlers.lib import SimpleHandler
+
+import netcdf4_pydap
+from conftest import start_server, stop_server, synthetic_dataset
+
+
+@pytest.fixture
+def servers():
+    servers = [start_server(SimpleHandler(synthetic_dataset(ntime=ntime)))
+               for ntime in [4, 2, 3]]
+    yield servers
+    for server in servers:
+        stop_server(server)
+
+
+def test_aggregation(servers):
+    """
+    Test reads within and across members.
+    """
+    expected = np.concatenate([np.arange(ntime * 15).reshape(ntime, 3, 5)
+                               for ntime in [4, 2, 3]])
+    with netcdf4_pydap.MFDataset([server.url for server in servers],
+                                 max_workers=3) as dataset:
+        assert dataset.aggdim == 'time'
+        assert len(dataset.dimensions['time']) == 9
+        assert dataset.dimensions['time'].isunlimited()
+        tas = dataset.variables['tas']
+        assert tas.shape == (9, 3, 5)
+        assert tas.units == 'K'
+        assert (tas[...] == expected).all()
+        assert (tas[2:8:2, 1] == expected[2:8:2, 1:2]).all()
+        assert (tas[5, :, 1:3] == expected[5:6, :, 1:3]).all()
+        assert (tas[[8, 0, 4]] == expected[[8, 0, 4]]).all()
+        assert tas[9:].shape == (0, 3, 5)
+        assert (dataset.variables['time'][:] ==
+                [0, 1, 2, 3, 0, 1, 0, 1, 2]).all()
+        # Variables without the aggregation dimension come from the
+        # first member:
+        assert (dataset.variables['lat'][:] == np.arange(3)).all()
+
+
+def test_mismatch(servers):
+    """
+    Test that members with different dimensions are rejected.
+    """
+    server = start_server(SimpleHandler(synthetic_dataset(nlat=4)))
+    try:
+        with pytest.raises(ValueError):
+            netcdf4_pydap.MFDataset([servers[0].url, server.url])
+    finally:
+        stop_server(server)
+
+
+def test_maskandscale():
+    """
+    Test that masking and scaling are set on the members.
+    """
+    servers = []
+    for ntime in [2, 3]:
+        member = synthetic_dataset(ntime=ntime)
+        member['tas'].attributes.update({'_FillValue': 0.0,
+                                         'scale_factor': 2.0})
+        servers.append(start_server(SimpleHandler(member)))
+    expected = np.ma.masked_equal(
+        np.concatenate([np.arange(ntime * 15).reshape(ntime, 3, 5)
+                        for ntime in [2, 3]]), 0) * 2.0
+    try:
+        with netcdf4_pydap.MFDataset([server.url for server in servers],
+                                     max_workers=2) as dataset:
+            tas = dataset.variables['tas']
+            assert not tas.mask and not tas.scale
+            tas.set_auto_maskandscale(True)
+            result = tas[...]
+            assert (result.mask == expected.mask).all()
+            assert np.ma.allclose(result, expected)
+            dataset.set_auto_mask(False)
+            assert not tas.mask and tas.scale
+            assert (tas[1:3, 0, 0].ravel() == [30, 0]).all()
+    finally:
+        for server in servers:
+            stop_server(server)
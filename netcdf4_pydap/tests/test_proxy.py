@@ -0,0 +1,136 @@
+"""
+Test module for the requests_pydap proxies.
+
+"""
+import numpy as np
+import pytest
+
+from pydap.handlers.lib import SimpleHandler
+
+import netcdf4_pydap
+from netcdf4_pydap.requests_pydap import proxy
+from conftest import start_server, stop_server, synthetic_dataset
+
+
+def test_tiles():
+    """
+    Test that tiles cover the output and respect the tile size.
+    """
+    slice_ = (slice(1, 10, 2), slice(0, 6, 1), slice(0, 8, 1))
+    shape = (10, 6, 8)
+    out = np.zeros(proxy._shape(slice_, shape))
+    tiles = proxy._tiles(slice_, shape, 4, 100)
+    for tile in tiles:
+        assert out[tile].size * 4 <= 100
+        out[tile] += 1
+    assert (out == 1).all()
+    assert len(proxy._tiles(slice_, shape, 4, 10 ** 6)) == 1
+
+
+def test_tile_slice():
+    """
+    Test the conversion of tiles to request slices.
+    """
+    slice_ = (slice(1, 10, 2), slice(2, 6, 1))
+    tile = (slice(1, 3), slice(0, 2))
+    assert (proxy._tile_slice(slice_, tile) ==
+            (slice(3, 6, 2), slice(2, 4, 1)))
+
+
+def test_tiled_read(opendap_server):
+    """
+    Test a read split into tiles fetched concurrently.
+    """
+    expected = np.arange(60).reshape(4, 3, 5)
+    with netcdf4_pydap.Dataset(opendap_server.url, max_workers=4,
+                               max_tile_size=16) as dataset:
+        data = dataset.variables['tas'][1:4, ::2, 1:]
+        # One request per (time, lat) pair:
+        assert opendap_server.requests == 2 + 3 * 2
+    assert (data == expected[1:4, ::2, 1:]).all()
+
+
+def test_runs():
+    """
+    Test the grouping of indices into strided runs.
+    """
+    runs = proxy._runs(np.array([0, 1, 2, 10, 20, 30, 31]))
+    assert [src for dest, src in runs] == [slice(0, 3, 1), slice(10, 31, 10),
+                                           slice(31, 32, 1)]
+    assert [dest for dest, src in runs] == [slice(0, 3), slice(3, 6),
+                                            slice(6, 7)]
+    runs = proxy._runs(np.array([0, 5, 6, 7]))
+    assert [src for dest, src in runs] == [slice(0, 1, 1), slice(5, 8, 1)]
+
+
+def test_orthogonal_read(opendap_server):
+    """
+    Test integer sequences and boolean masks.
+    """
+    expected = np.arange(60).reshape(4, 3, 5)
+    mask = np.array([True, False, True, True, False])
+    for max_workers in [1, 4]:
+        with netcdf4_pydap.Dataset(opendap_server.url,
+                                   max_workers=max_workers) as dataset:
+            requests = opendap_server.requests
+            data = dataset.variables['tas'][[3, 0, 3], :, mask]
+            # Times 0 and 3 form one run, longitudes 0, 2 and 3 two runs:
+            assert opendap_server.requests == requests + 2
+            assert (data == expected[np.ix_([3, 0, 3], range(3),
+                                            [0, 2, 3])]).all()
+            data = dataset.variables['tas'][1, [-1, 0], 1:3]
+            assert (data == expected[1:2, [2, 0], 1:3]).all()
+            data = dataset.variables['lat'][[2, 0]]
+            assert (data == [2, 0]).all()
+            assert dataset.variables['lon'][[]].shape == (0,)
+
+
+def test_read_into(opendap_server, tmpdir):
+    """
+    Test reads decoded directly into memory-mapped and other buffers.
+    """
+    expected = np.arange(60).reshape(4, 3, 5)
+    for max_workers in [1, 4]:
+        with netcdf4_pydap.Dataset(opendap_server.url, max_workers=max_workers,
+                                   max_tile_size=16) as dataset:
+            tas = dataset.variables['tas']
+            requests = opendap_server.requests
+            out = np.memmap(str(tmpdir.join('tas%d' % max_workers)),
+                            dtype=tas.dtype, mode='w+', shape=(3, 2, 4))
+            assert tas.read_into(out, (slice(1, 4), slice(None, None, 2),
+                                       slice(1, None))) is out
+            # One request per (time, lat) pair:
+            assert opendap_server.requests == requests + 3 * 2
+            assert (out == expected[1:4, ::2, 1:]).all()
+
+            # Integers keep their axis in a buffer of the same size:
+            buf = bytearray(3 * 5 * 4)
+            tas.read_into(buf, 2)
+            assert (np.frombuffer(buf, dtype='>f4').reshape(3, 5) ==
+                    expected[2]).all()
+            out = np.zeros((3, 5), dtype='f8')
+            tas.read_into(out, 2)
+            assert (out == expected[2]).all()
+
+            with pytest.raises(ValueError):
+                tas.read_into(np.zeros(4, dtype='f4'), 0)
+            with pytest.raises(IndexError):
+                tas.read_into(out, [0, 1])
+
+
+def test_negative_step():
+    """
+    Test that keys with negative steps are not split into tiles.
+    """
+    server = start_server(SimpleHandler(synthetic_dataset(ntime=10)))
+    expected = np.arange(150).reshape(10, 3, 5)
+    try:
+        with netcdf4_pydap.Dataset(server.url, max_workers=3,
+                                   max_tile_size=64) as dataset:
+            tas = dataset.variables['tas']
+            assert (tas[8:1:-2] == expected[8:1:-2]).all()
+            out = np.empty((4, 3, 5), dtype=tas.dtype)
+            tas.read_into(out, slice(8, 1, -2))
+            assert (out == expected[8:1:-2]).all()
+    finally:
+        stop_server(server)
@@ -0,0 +1,83 @@
+"""
+Test module for block by block reductions.
+
+"""
+import numpy as np
+import pytest
+from pydap.model import BaseType, Int16
+from pydap.handlers.lib import SimpleHandler
+
+import netcdf4_pydap
+from conftest import start_server, stop_server, synthetic_dataset
+
+
+@pytest.fixture
+def missing_server():
+    """
+    A server whose tas has missing values.
+    """
+    dataset = synthetic_dataset(ntime=6)
+    data = dataset['tas']['tas'].data.copy()
+    data[1, 1, :] = 1e20
+    data[2, 0, 0] = np.nan
+    data[:, 2, 4] = 1e20
+    dataset['tas']['tas'].data = data
+    dataset['tas'].attributes['_FillValue'] = 1e20
+    dataset['pr'] = BaseType('pr', np.arange(30, dtype='>i2').reshape(6, 5),
+                             shape=(6, 5), dimensions=('time', 'lon'),
+                             type=Int16)
+    dataset._set_id()
+    server = start_server(SimpleHandler(dataset))
+    yield server
+    stop_server(server)
+
+
+@pytest.mark.parametrize('max_workers', [1, 3])
+@pytest.mark.parametrize('axis', [None, 0, (1, 2), -1])
+def test_reductions(missing_server, axis, max_workers):
+    with netcdf4_pydap.Dataset(missing_server.url) as dataset:
+        tas = dataset.variables['tas']
+        expected = np.ma.masked_invalid(tas[...].astype(np.float64))
+        expected = np.ma.masked_values(expected, 1e20)
+        for operation in ['sum', 'mean', 'min', 'max', 'count']:
+            # Blocks of 2 rows of 5 values:
+            result = getattr(tas, operation)(axis=axis, block_size=40,
+                                             max_workers=max_workers)
+            assert np.ma.allclose(result,
+                                  getattr(expected, operation)(axis=axis))
+            if operation != 'count':
+                assert (np.ma.getmaskarray(result) ==
+                        (expected.count(axis=axis) == 0)).all()
+
+
+def test_integer_reductions(missing_server):
+    with netcdf4_pydap.Dataset(missing_server.url) as dataset:
+        pr = dataset.variables['pr']
+        expected = np.arange(30).reshape(6, 5)
+        assert pr.mean() == 14.5
+        assert np.allclose(pr.mean(axis=0, block_size=20),
+                           expected.mean(axis=0))
+        assert pr.sum(block_size=20) == expected.sum()
+        assert pr.max(axis=1).tolist() == expected.max(axis=1).tolist()
+
+
+def test_histogram(opendap_server):
+    with netcdf4_pydap.Dataset(opendap_server.url) as dataset:
+        tas = dataset.variables['tas']
+        requests = opendap_server.requests
+        counts, edges = tas.histogram(bins=6)
+        # One pass for the range, one for the counts:
+        assert opendap_server.requests == requests + 2
+        expected = np.histogram(tas[...], bins=6)
+        assert (counts == expected[0]).all()
+        counts, edges = tas.histogram(bins=6, block_size=40)
+        assert (counts == expected[0]).all()
+        assert np.allclose(edges, expected[1])
+        counts, edges = tas.histogram(bins=[0, 10, 100], block_size=40)
+        assert list(counts) == [10, 50]
+
+
+def test_reduction_errors(opendap_server):
+    with netcdf4_pydap.Dataset(opendap_server.url) as dataset:
+        with pytest.raises(ValueError):
+            dataset.variables['tas'].mean(axis=3)
@@ -0,0 +1,79 @@
+"""
+Test module for retries and circuit breakers.
+
+"""
+import numpy as np
+import pytest
+import requests
+from pydap.handlers.lib import SimpleHandler
+
+import netcdf4_pydap
+from netcdf4_pydap.retries import RetryPolicy, CircuitOpenError
+from conftest import (FileApp, FlakyApp, start_server, stop_server,
+                      synthetic_dataset)
+
+
+@pytest.mark.parametrize('extension', ['dds', 'dods'])
+def test_retry(extension):
+    """
+    Test that metadata and data requests answered with 503 are retried.
+    """
+    app = FlakyApp(SimpleHandler(synthetic_dataset()), 2, extension)
+    server = start_server(app)
+    try:
+        with netcdf4_pydap.Dataset(
+                server.url, retry=RetryPolicy(backoff_factor=0.01)) as dataset:
+            data = dataset.variables['tas'][1, :, :]
+    finally:
+        stop_server(server)
+    assert (data == np.arange(60).reshape(4, 3, 5)[1:2]).all()
+    assert app.failed == 2
+
+
+@pytest.mark.parametrize('max_connections', [1, 4])
+def test_wget_retry(tmpdir, max_connections):
+    """
+    Test that failed downloads are retried.
+    """
+    content = np.random.RandomState(0).bytes(10000)
+    app = FlakyApp(FileApp(content), 3)
+    server = start_server(app)
+    dest_name = str(tmpdir.join('file.nc'))
+    try:
+        with netcdf4_pydap.http_Dataset(
+                server.url, retry=RetryPolicy(backoff_factor=0.01)) as dataset:
+            dataset.wget(dest_name, max_connections=max_connections,
+                         range_size=3000)
+    finally:
+        stop_server(server)
+    with open(dest_name, 'rb') as dest_file:
+        assert dest_file.read() == content
+    assert app.failed == 3
+
+
+def test_circuit_breaker():
+    """
+    Test that requests to a host that keeps failing fail immediately.
+    """
+    app = FlakyApp(SimpleHandler(synthetic_dataset()), 100)
+    server = start_server(app)
+    policy = RetryPolicy(max_retries=5, backoff_factor=0.01,
+                         failure_threshold=2, reset_after=60)
+    try:
+        with pytest.raises(CircuitOpenError):
+            netcdf4_pydap.Dataset(server.url, retry=policy)
+        # The DAS and DDS are requested concurrently:
+        failed = app.failed
+        assert failed <= 3
+        with pytest.raises(requests.exceptions.ConnectionError):
+            netcdf4_pydap.Dataset(server.url, retry=policy)
+        assert app.failed == failed
+    finally:
+        stop_server(server)
+
+
+def test_backoff():
+    policy = RetryPolicy(backoff_factor=1, max_backoff=5)
+    assert all(0 <= policy.backoff(1) <= 2 for index in range(100))
+    assert all(policy.backoff(10) <= 5 for index in range(100))
+    assert policy.backoff(0, retry_after=120) == 5
@@ -0,0 +1,67 @@
+"""
+Test module for request statistics.
+
+"""
+import numpy as np
+import pytest
+
+import netcdf4_pydap
+from netcdf4_pydap.stats import Stats
+
+
+def test_dataset_stats(opendap_server):
+    """
+    Test the requests, bytes and timings recorded by a dataset.
+    """
+    recorded = []
+    process_stats = Stats()
+    process_stats.add_hook(lambda name, value, tags:
+                           recorded.append((name, tags['url'])))
+    stats = Stats(parent=process_stats)
+    with netcdf4_pydap.Dataset(opendap_server.url, stats=stats) as dataset:
+        data = dataset.variables['tas'][...]
+    assert (data == np.arange(60).reshape(4, 3, 5)).all()
+
+    counters = stats.snapshot()['counters']
+    assert counters['requests.dds'] == 1
+    assert counters['requests.das'] == 1
+    assert counters['requests.dods'] == 1
+    assert counters['bytes.dods'] > data.nbytes
+    assert 'errors.dods' not in counters
+    timings = stats.snapshot()['timings']
+    for name in ['time_to_first_byte.dods', 'decode', 'parse.dds',
+                 'parse.das', 'download.dds']:
+        assert timings[name]['count'] == 1
+        assert sum(timings[name]['buckets'].values()) == 1
+
+    assert process_stats.snapshot() == stats.snapshot()
+    assert 'decode' in [name for name, url in recorded]
+    assert all(url.startswith(opendap_server.url) for name, url in recorded)
+
+
+def test_default_stats(opendap_server):
+    """
+    Test that datasets count in the process-wide stats by default.
+    """
+    before = netcdf4_pydap.process_stats.counters.get('requests.dds', 0)
+    with netcdf4_pydap.Dataset(opendap_server.url) as dataset:
+        assert dataset.stats.counters['requests.dds'] == 1
+    assert (netcdf4_pydap.process_stats.counters['requests.dds'] ==
+            before + 1)
+
+
+def test_faulty_hook(opendap_server):
+    """
+    Test that an exception raised by a hook does not fail the read.
+    """
+    def hook(name, value, tags):
+        raise ValueError(name)
+
+    stats = Stats()
+    stats.add_hook(hook)
+    with pytest.warns(RuntimeWarning):
+        with netcdf4_pydap.Dataset(opendap_server.url,
+                                   stats=stats) as dataset:
+            data = dataset.variables['tas'][0, 0, :]
+    assert (data == np.arange(5)).all()
+    assert stats.counters['requests.dods'] == 1
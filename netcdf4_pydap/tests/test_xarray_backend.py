@@ -0,0 +1,38 @@
+"""
+Test module for the xarray backend.
+
+"""
+import numpy as np
+import pytest
+
+xarray = pytest.importorskip('xarray')
+from netcdf4_pydap import xarray_backend
+
+
+@pytest.fixture
+def dataset(opendap_server):
+    dataset = xarray_backend.open_dataset(opendap_server.url,
+                                          dataset_kwargs={'timeout': 10})
+    yield dataset
+    dataset.close()
+
+
+def test_open_dataset(dataset):
+    assert dataset['tas'].dims == ('time', 'lat', 'lon')
+    assert dataset['tas'].attrs['units'] == 'K'
+    assert dataset.attrs['title'] == 'synthetic'
+    assert dataset.encoding.get('unlimited_dims', set(['time'])) == set(['time'])
+    assert (dataset['lat'].values == np.arange(3)).all()
+
+
+def test_indexing(dataset):
+    expected = np.arange(60).reshape(4, 3, 5)
+    tas = dataset['tas']
+    assert (tas[1].values == expected[1]).all()
+    assert (tas[[3, 0], 2, 1:4].values == expected[[3, 0], 2, 1:4]).all()
+    assert (tas.isel(time=1, lon=[0, 2, 3]).values ==
+            expected[1][:, [0, 2, 3]]).all()
+    # Vectorized indexing:
+    points = xarray.DataArray([0, 2], dims='points')
+    assert (tas.isel(time=points, lat=points, lon=0).values ==
+            expected[[0, 2], [0, 2], 0]).all()
@@ -0,0 +1,113 @@
+"""
+Test module for the vectorized XDR decoder.
+
+"""
+import numpy as np
+from pydap.model import (DatasetType, BaseType, StructureType,
+                         Byte, Int16, Float32, Float64, String)
+from pydap.responses.dods import DODSResponse
+from pydap.parsers.dds import DDSParser
+from pydap.xdr import DapUnpacker
+
+from netcdf4_pydap.requests_pydap import xdr
+from conftest import synthetic_dataset
+
+
+def _dods(dataset):
+    return ''.join(DODSResponse.serialize(dataset))
+
+
+def _assert_same(value, expected):
+    if isinstance(expected, tuple):
+        assert len(value) == len(expected)
+        for sub_value, sub_expected in zip(value, expected):
+            _assert_same(sub_value, sub_expected)
+    else:
+        assert np.shape(value) == np.shape(expected)
+        assert (value == expected).all()
+
+
+def _expected(data):
+    dds, xdrdata = data.split(xdr.DATA_MARKER, 1)
+    return DapUnpacker(xdrdata, DDSParser(dds).parse()).getvalue()
+
+
+def _check(dataset):
+    data = _dods(dataset)
+    reader = xdr.StreamReader([data])
+    value = xdr.unpack_stream(reader, DDSParser(reader.read_header()).parse())
+    _assert_same(value, _expected(data))
+    return value
+
+
+def test_grid():
+    """
+    Test a Grid with its maps.
+    """
+    value = _check(synthetic_dataset())
+    assert value[0][0].dtype == np.dtype('>f4')
+    assert value[0][0].flags.writeable
+
+
+def test_bytes_and_scalars():
+    """
+    Test padded bytes and scalars in a structure.
+    """
+    dataset = DatasetType('test')
+    dataset['flags'] = BaseType('flags', np.arange(7, dtype='B'),
+                                shape=(7,), dimensions=('x',), type=Byte)
+    structure = StructureType('s')
+    structure['scalar'] = BaseType('scalar', np.array(3, dtype='>i4'),
+                                   type=Int16)
+    structure['value'] = BaseType('value', np.array(2.5, dtype='>f8'),
+                                  type=Float64)
+    dataset['s'] = structure
+    dataset['last'] = BaseType('last', np.ones((2, 3), dtype='>f4'),
+                               shape=(2, 3), dimensions=('y', 'x'),
+                               type=Float32)
+    dataset._set_id()
+    _check(dataset)
+
+
+def test_strings_fallback():
+    """
+    Test that strings are left to DapUnpacker.
+    """
+    dataset = DatasetType('test')
+    dataset['names'] = BaseType('names', np.array(['a', 'bcd', 'ef']),
+                                shape=(3,), dimensions=('x',), type=String)
+    dataset._set_id()
+    assert not xdr.is_vectorizable(dataset)
+    _check(dataset)
+
+
+def _chunks(data, size):
+    return (data[start:start + size] for start in range(0, len(data), size))
+
+
+def test_stream():
+    """
+    Test decoding a response delivered in small chunks.
+    """
+    data = _dods(synthetic_dataset())
+    expected = _expected(data)
+    for size in [1, 7, 4096]:
+        reader = xdr.StreamReader(_chunks(data, size))
+        parsed = DDSParser(reader.read_header()).parse()
+        _assert_same(xdr.unpack_stream(reader, parsed), expected)
+
+
+def test_stream_targets():
+    """
+    Test decoding into given arrays, with and without conversion.
+    """
+    data = _dods(synthetic_dataset())
+    expected = np.arange(60).reshape(4, 3, 5)
+    for out in [np.empty((4, 3, 5), dtype='>f4'),
+                np.empty((4, 3, 5), dtype='f8'),
+                np.empty((4, 3, 10), dtype='f4')[..., ::2]]:
+        reader = xdr.StreamReader(_chunks(data, 16))
+        parsed = DDSParser(reader.read_header()).parse()
+        value = xdr.unpack_stream(reader, parsed, {'tas.tas': out})
+        assert value[0][0] is out
+        assert (out == expected).all()
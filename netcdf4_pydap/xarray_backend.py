@@ -0,0 +1,180 @@
+"""
+An xarray backend for netcdf4_pydap datasets.
+
+With xarray 0.18 or later, the backend is registered as an entry point::
+
+    xarray.open_dataset(url, engine='netcdf4_pydap', timeout=60)
+
+Keyword arguments that xarray does not use are passed to
+netcdf4_pydap.Dataset. With earlier versions, use open_dataset from this
+module, or pass a NetCDF4PydapDataStore to xarray.open_dataset.
+
+Variables are wrapped in lazily indexed arrays. Outer indexers, and the
+outer part of vectorized indexers, are read by hyperslabs through
+ArrayProxy, with integer sequences read by runs as in Variable.__getitem__.
+All the variables of a dataset are read with the session of its Dataset.
+
+xarray is an optional dependency.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import xarray
+from xarray.core import indexing
+from xarray.core.utils import Frozen
+from xarray.backends.common import AbstractDataStore, BackendArray
+
+from . import core
+
+try:
+    from xarray.backends import BackendEntrypoint
+except ImportError:
+    # xarray < 0.18 has no backend entry points:
+    BackendEntrypoint = object
+
+__all__ = ['NetCDF4PydapDataStore', 'NetCDF4PydapBackendEntrypoint',
+           'open_dataset']
+
+# Renamed in xarray 0.18:
+_LazilyIndexedArray = getattr(indexing, 'LazilyIndexedArray', None)
+if _LazilyIndexedArray is None:
+    _LazilyIndexedArray = indexing.LazilyOuterIndexedArray
+
+
+class NetCDF4PydapArrayWrapper(BackendArray):
+    def __init__(self, variable):
+        self.variable = variable
+        self.shape = variable.shape
+        self.dtype = variable.dtype
+
+    def __getitem__(self, key):
+        return indexing.explicit_indexing_adapter(
+            key, self.shape, indexing.IndexingSupport.OUTER, self._getitem)
+
+    def _getitem(self, key):
+        return outer_getitem(self.variable, key)
+
+
+def outer_getitem(variable, key):
+    """
+    Read an outer index of integers, slices and integer arrays from a
+    core.Variable. Integers drop their axis, as in numpy.
+    """
+    key = tuple(key)
+    if any(np.size(item) == 0 for item in key
+           if isinstance(item, np.ndarray)):
+        # Nothing to request:
+        shape = [len(np.arange(length)[item]) for item, length
+                 in zip(key, variable.shape)
+                 if not isinstance(item, (int, long, np.integer))]
+        return np.empty(shape, dtype=variable.dtype)
+    result = variable[key]
+    axis = tuple(position for position, item in enumerate(key)
+                 if isinstance(item, (int, long, np.integer)))
+    if axis:
+        result = np.squeeze(result, axis)
+    return result
+
+
+def _fix_attributes(attributes):
+    """
+    Flatten nested DAP attributes to dot-separated keys.
+    """
+    fixed = OrderedDict()
+    for name, value in attributes.items():
+        if isinstance(value, dict):
+            for child, child_value in value.items():
+                fixed['%s.%s' % (name, child)] = child_value
+        else:
+            fixed[name] = value
+    return fixed
+
+
+class NetCDF4PydapDataStore(AbstractDataStore):
+    """
+    Store for reading a netcdf4_pydap.Dataset with xarray.
+    """
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    @classmethod
+    def open(cls, url, **kwargs):
+        """
+        Open `url`, passing `kwargs` to netcdf4_pydap.Dataset.
+        """
+        return cls(core.Dataset(url, **kwargs))
+
+    def open_store_variable(self, name, var):
+        data = _LazilyIndexedArray(NetCDF4PydapArrayWrapper(var))
+        attributes = _fix_attributes(OrderedDict(
+            (attr, var.getncattr(attr)) for attr in var.ncattrs()))
+        return xarray.Variable(var.dimensions, data, attributes)
+
+    def get_variables(self):
+        return Frozen(OrderedDict(
+            (name, self.open_store_variable(name, self.dataset.variables[name]))
+            for name in self.dataset.variables))
+
+    def get_attrs(self):
+        return Frozen(_fix_attributes(OrderedDict(
+            (attr, self.dataset.getncattr(attr))
+            for attr in self.dataset.ncattrs())))
+
+    def get_dimensions(self):
+        return Frozen(OrderedDict(
+            (name, len(self.dataset.dimensions[name]))
+            for name in self.dataset.dimensions))
+
+    def get_encoding(self):
+        return {'unlimited_dims':
+                set(name for name in self.dataset.dimensions
+                    if self.dataset.dimensions[name].isunlimited())}
+
+    def close(self):
+        self.dataset.close()
+
+
+class NetCDF4PydapBackendEntrypoint(BackendEntrypoint):
+    """
+    Backend of ``xarray.open_dataset(url, engine='netcdf4_pydap')``.
+    """
+    description = 'Open OPeNDAP datasets with netcdf4_pydap'
+    # Other keyword arguments are passed to netcdf4_pydap.Dataset:
+    open_dataset_parameters = ('filename_or_obj', 'mask_and_scale',
+                               'decode_times', 'concat_characters',
+                               'decode_coords', 'drop_variables',
+                               'use_cftime', 'decode_timedelta')
+
+    def open_dataset(self, filename_or_obj, mask_and_scale=True,
+                     decode_times=True, concat_characters=True,
+                     decode_coords=True, drop_variables=None,
+                     use_cftime=None, decode_timedelta=None, **kwargs):
+        from xarray.backends.store import StoreBackendEntrypoint
+
+        store = NetCDF4PydapDataStore.open(filename_or_obj, **kwargs)
+        try:
+            return StoreBackendEntrypoint().open_dataset(
+                store, mask_and_scale=mask_and_scale,
+                decode_times=decode_times,
+                concat_characters=concat_characters,
+                decode_coords=decode_coords, drop_variables=drop_variables,
+                use_cftime=use_cftime, decode_timedelta=decode_timedelta)
+        except:
+            store.close()
+            raise
+
+    def guess_can_open(self, filename_or_obj):
+        # Other backends also open urls; this one must be asked for:
+        return False
+
+
+def open_dataset(url, dataset_kwargs=None, **kwargs):
+    """
+    Open `url` as an xarray.Dataset.
+
+    `dataset_kwargs` are passed to netcdf4_pydap.Dataset and `kwargs`
+    to xarray.open_dataset.
+    """
+    store = NetCDF4PydapDataStore.open(url, **(dataset_kwargs or {}))
+    return xarray.open_dataset(store, **kwargs)
@@ -37,6 +37,15 @@ setup(
                             'requests_cache',
                             'netCDF4',
                             'pydap==3.1.1',
-                            'MechanicalSoup'],
+                            'MechanicalSoup',
+                            'six'],
+        extras_require = {'dask': ['dask[array]'],
+                          'xarray': ['xarray']},
+        entry_points={
+            'console_scripts': [
+                'netcdf4_pydap_download=netcdf4_pydap.download:main'],
+            'xarray.backends': [
+                'netcdf4_pydap=netcdf4_pydap.xarray_backend:NetCDF4PydapBackendEntrypoint'],
+            },
         zip_safe=False,
     )